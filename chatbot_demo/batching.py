@@ -0,0 +1,156 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import torch
+import torch.nn.functional as F
+
+# turn a batch of logits into {"label": ..., "score": ...} per row
+def to_predictions(model, logits) -> list:
+    scores, labels = F.softmax(logits, dim=1).max(dim=1)
+    return [{"label": model.config.id2label[label], "score": score} for label, score in zip(labels.tolist(), scores.tolist())]
+
+
+# split text positions into buckets of similar token length. Returns lists of positions, shortest texts first
+# NOTE: a bucket is closed once it holds "batch_size" texts, or (with max_tokens) once its padded size (texts * longest text) would go over max_tokens, so short texts end up in big buckets and long texts in small ones
+def buckets(lengths: list, batch_size: int = 32, max_tokens: int = None) -> list:
+    order = sorted(range(len(lengths)), key=lengths.__getitem__)
+
+    result = []
+    bucket = []
+    for position in order:
+        # sorted by length, so the text being added is always the longest in the bucket
+        full = len(bucket) >= batch_size or (max_tokens and bucket and (len(bucket) + 1) * lengths[position] > max_tokens)
+        if full:
+            result.append(bucket)
+            bucket = []
+        bucket.append(position)
+
+    if bucket:
+        result.append(bucket)
+    return result
+
+
+# model inputs for already tokenized texts, padded to the longest one. sequences holds (input ids, token type ids) per text
+# NOTE: built by hand because tokenizer.pad is slow for fast tokenizers, and the ids are already there. token_type_ids is only included when the model takes it (ex. BERT, but not RoBERTa or DistilBERT)
+def pad_batch(sequences: list, pad_token_id: int, token_types: bool = False) -> dict:
+    longest = max(len(ids) for ids, _ in sequences)
+    input_ids = torch.full((len(sequences), longest), pad_token_id)
+    attention_mask = torch.zeros((len(sequences), longest), dtype=torch.long)
+    token_type_ids = torch.zeros((len(sequences), longest), dtype=torch.long)
+    for row, (ids, types) in enumerate(sequences):
+        input_ids[row, :len(ids)] = torch.tensor(ids)
+        attention_mask[row, :len(ids)] = 1
+        token_type_ids[row, :len(types)] = torch.tensor(types)
+
+    batch = {"input_ids": input_ids, "attention_mask": attention_mask}
+    if token_types:
+        batch["token_type_ids"] = token_type_ids
+    return batch
+
+
+# classify texts of very different lengths without wasting compute on padding
+# NOTE: with padding=True every text in a batch is padded to the longest one, so one long text in a batch of short ones makes the model process mostly [PAD] tokens. Here texts are grouped with texts of a similar token length, and each group is only padded to its own longest text. Results come back in the original order
+def classify_bucketed(model, tokenizer, texts: list, batch_size: int = 32, max_tokens: int = None, max_length: int = 512) -> list:
+    lengths = [len(ids) for ids in tokenizer(texts, truncation=True, max_length=max_length)["input_ids"]]
+
+    results = [None] * len(texts)
+    for bucket in buckets(lengths, batch_size, max_tokens):
+        # NOTE: tokenizing the bucket again is far cheaper than the forward pass, and quicker than padding the first encoding with tokenizer.pad
+        batch = tokenizer([texts[position] for position in bucket], padding=True, truncation=True, max_length=max_length, return_tensors="pt")
+        with torch.no_grad():
+            predictions = to_predictions(model, model(**batch).logits)
+
+        for position, prediction in zip(bucket, predictions):
+            results[position] = prediction
+    return results
+
+
+# a front end for a sequence classification model that groups requests from many callers into one forward pass
+# NOTE: running the model on 32 sentences at once costs far less than 32 separate runs (the matrix math is shared and the per call overhead is paid once), but a single caller usually only has one sentence. Here every caller submits their own text, and a scheduler thread waits until "max_batch" texts have arrived or the oldest one has waited "max_wait" seconds, whichever comes first, then runs them all together
+# NOTE: under light load a text waits at most max_wait before running on its own, and under heavy load batches fill up instantly, so the wait only ever costs a few milliseconds
+class BatchingClassifier:
+    def __init__(self, model, tokenizer, max_batch: int = 32, max_wait: float = 0.005, max_length: int = 512, max_tokens: int = None):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.max_batch = max_batch
+        self.max_wait = max_wait # seconds
+        self.max_length = max_length
+
+        # padded tokens allowed per forward pass. When set, a batch that mixes short and long texts is split into buckets of similar length (see classify_bucketed) instead of padding everything to the longest text
+        self.max_tokens = max_tokens
+        self.model.eval()
+
+        self._queue = queue.Queue() # (text, future), or None to stop
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    # queue a text. The future's result is {"label": ..., "score": ...}
+    def submit(self, text: str) -> Future:
+        future = Future()
+        self._queue.put((text, future))
+        return future
+
+    # classify one text, waiting for its batch to run
+    def classify(self, text: str) -> dict:
+        return self.submit(text).result()
+
+    def __call__(self, text: str) -> dict:
+        return self.classify(text)
+
+    def _next_batch(self) -> list:
+        # block until there is at least one request
+        first = self._queue.get()
+        if first is None:
+            return None
+
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                # NOTE: whatever is already queued is taken without waiting, even once the deadline has passed
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None) # stop after this batch
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+
+            # callers that gave up (ex. cancelled their future) are skipped
+            batch = [(text, future) for text, future in batch if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+
+            try:
+                results = self._forward([text for text, _ in batch])
+            except Exception as error:
+                for _, future in batch:
+                    future.set_exception(error)
+                continue
+
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+
+    def _forward(self, texts: list) -> list:
+        if self.max_tokens:
+            return classify_bucketed(self.model, self.tokenizer, texts, self.max_batch, self.max_tokens, self.max_length)
+
+        # NOTE: padding=True pads every text to the longest one in this batch
+        batch = self.tokenizer(texts, padding=True, truncation=True, max_length=self.max_length, return_tensors="pt")
+        with torch.no_grad():
+            return to_predictions(self.model, self.model(**batch).logits)
+
+    # stop the scheduler once everything already queued has run
+    def close(self) -> None:
+        self._queue.put(None)
+        self._thread.join()
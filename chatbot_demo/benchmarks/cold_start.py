@@ -0,0 +1,108 @@
+# import time, time to first prediction and memory of a fresh process: the usual top level imports + from_pretrained (pickled .bin weights, then safetensors) vs fast_start.MappedClassifier (lazy imports + local safetensors)
+# every measurement runs in a brand new python process, a few times over, and the median is reported. The model is exported to a temporary local cache first
+# run from the chatbot_demo folder: python -m benchmarks.cold_start --runs 5
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+# resident, anonymous and file backed memory of the current process in MB (linux only)
+# NOTE: anonymous memory is what each process pays for on its own. Memory mapped weights are file pages instead: they live in the OS page cache once, no matter how many processes map them
+MEMORY = """
+def memory():
+    values = {}
+    with open("/proc/self/smaps_rollup") as file:
+        for line in file.readlines()[1:]:
+            key, value = line.split(":")
+            values[key] = int(value.split()[0]) / 1024
+    return values["Rss"], values["Anonymous"], values["Rss"] - values["Anonymous"]
+
+# MB of the model's parameters that point into a file mapping (ie. the weights file itself) rather than memory of this process
+# NOTE: most of a process's anonymous memory is torch and transformers themselves (about 340 MB just to import them), so this is the number that shows whether the weights were copied
+def mapped(model):
+    regions = []
+    with open("/proc/self/maps") as file:
+        for line in file:
+            fields = line.split()
+            if len(fields) > 5 and fields[5].startswith("/"):
+                start, end = (int(address, 16) for address in fields[0].split("-"))
+                regions.append((start, end))
+
+    total = 0
+    for parameter in model.parameters():
+        pointer = parameter.data_ptr()
+        if any(start <= pointer < end for start, end in regions):
+            total += parameter.numel() * parameter.element_size()
+    return total / 1e6
+"""
+
+EAGER = MEMORY + """
+import time
+start = time.perf_counter()
+import torch
+import torch.nn.functional as F
+from transformers import AutoTokenizer, AutoModelForSequenceClassification
+imported = time.perf_counter()
+tokenizer = AutoTokenizer.from_pretrained(FOLDER)
+model = AutoModelForSequenceClassification.from_pretrained(FOLDER, use_safetensors=SAFETENSORS).eval()
+with torch.no_grad():
+    F.softmax(model(**tokenizer(["I am loving this coffee"], return_tensors="pt")).logits, dim=1)
+first = time.perf_counter()
+print(json.dumps([imported - start, first - start, *memory(), mapped(model)]))
+"""
+
+FAST = MEMORY + """
+import time
+start = time.perf_counter()
+from fast_start import MappedClassifier
+imported = time.perf_counter()
+classifier = MappedClassifier(MODEL)
+classifier(["I am loving this coffee"])
+first = time.perf_counter()
+print(json.dumps([imported - start, first - start, *memory(), mapped(classifier.model)]))
+"""
+
+def run(code: str, cache: str, model_name: str, folder: str, safetensors: bool) -> list:
+    prelude = f"import json\nMODEL = {model_name!r}\nFOLDER = {folder!r}\nSAFETENSORS = {safetensors!r}\n"
+    env = {**os.environ, "CHATBOT_MODEL_CACHE": cache, "HF_HUB_OFFLINE": "1", "TRANSFORMERS_VERBOSITY": "error"}
+    output = subprocess.run([sys.executable, "-c", prelude + code], env=env, capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", default="distilbert-base-uncased-finetuned-sst-2-english")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    cache = tempfile.mkdtemp()
+    os.environ["CHATBOT_MODEL_CACHE"] = cache
+
+    # NOTE: imported only now, so it picks up the temporary cache folder
+    import fast_start
+    from benchmarks.models import load_classifier
+
+    tokenizer, model = load_classifier(args.model)
+    folder = fast_start.export(args.model, tokenizer, model)
+    size = os.path.getsize(os.path.join(folder, "model.safetensors")) / 1e6
+
+    # the same weights as a pickled pytorch_model.bin, like older checkpoints ship
+    pickled = os.path.join(cache, "pickled")
+    tokenizer.save_pretrained(pickled)
+    model.save_pretrained(pickled, safe_serialization=False)
+
+    print(f"{args.model}: {size:.0f} MB of weights, median of {args.runs} fresh processes (files already in the OS page cache)")
+    print(f"{'start':34} {'import s':>9} {'first prediction s':>19} {'RSS MB':>7} {'anonymous MB':>13} {'file backed MB':>15} {'mapped weights MB':>18}")
+    for label, code, path, safetensors in [
+        ("top level imports, .bin weights", EAGER, pickled, False),
+        ("top level imports, safetensors", EAGER, folder, True),
+        ("fast_start (lazy, safetensors)", FAST, folder, True),
+    ]:
+        runs = [run(code, cache, args.model, path, safetensors) for _ in range(args.runs)]
+        imported, first, rss, anonymous, file_backed, weights = (statistics.median(column) for column in zip(*runs))
+        print(f"{label:34} {imported:9.2f} {first:19.2f} {rss:7.0f} {anonymous:13.0f} {file_backed:15.0f} {weights:18.0f}")
+
+if __name__ == "__main__":
+    main()
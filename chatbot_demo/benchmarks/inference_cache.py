@@ -0,0 +1,68 @@
+# speed of the sentiment classifier on traffic where many inputs repeat (canned replies, common phrases), with and without the token/prediction cache
+# run from the chatbot_demo folder: python -m benchmarks.inference_cache --requests 2048 --unique 20
+import argparse
+import random
+import time
+
+import torch
+import torch.nn.functional as F
+
+from cache import CachedClassifier
+from benchmarks.models import load_classifier, make_sentences
+
+# "requests" texts, "repeated" percent of them drawn from a small pool of common phrases (the most common ones far more often than the rest) and the rest seen only once
+def make_traffic(requests: int, pool: int, repeated: float, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    phrases = make_sentences(pool, longest=12, seed=seed + 1)
+    weights = [1 / (rank + 1) for rank in range(pool)] # zipf like
+    unique = iter(make_sentences(requests, seed=seed + 2))
+
+    traffic = []
+    for _ in range(requests):
+        if rng.random() < repeated:
+            # NOTE: the same phrase typed slightly differently is still the same input after normalizing
+            phrase = rng.choices(phrases, weights)[0]
+            traffic.append(phrase.upper() if rng.random() < 0.1 else f" {phrase}  ")
+        else:
+            traffic.append(next(unique))
+    return traffic
+
+def uncached(model, tokenizer, texts: list) -> list:
+    batch = tokenizer(texts, padding=True, truncation=True, max_length=512, return_tensors="pt")
+    with torch.no_grad():
+        return F.softmax(model(**batch).logits, dim=1).argmax(dim=1).tolist()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", default="distilbert-base-uncased-finetuned-sst-2-english")
+    parser.add_argument("--requests", type=int, default=2048)
+    parser.add_argument("--pool", type=int, default=300, help="number of common phrases")
+    parser.add_argument("--repeated", type=float, default=0.8, help="share of requests that are common phrases")
+    parser.add_argument("--batch-size", type=int, default=32)
+    args = parser.parse_args()
+
+    tokenizer, model = load_classifier(args.model)
+    model.eval()
+    traffic = make_traffic(args.requests, args.pool, args.repeated)
+    batches = [traffic[start:start + args.batch_size] for start in range(0, len(traffic), args.batch_size)]
+    uncached(model, tokenizer, batches[0]) # warm up
+
+    start = time.perf_counter()
+    for batch in batches:
+        uncached(model, tokenizer, batch)
+    plain = time.perf_counter() - start
+
+    classifier = CachedClassifier(model, tokenizer, args.model)
+    start = time.perf_counter()
+    for batch in batches:
+        classifier(batch)
+    cached = time.perf_counter() - start
+
+    stats = classifier.cache.stats()
+    print(f"{args.requests} requests, {args.repeated:.0%} from {args.pool} common phrases, batches of {args.batch_size}")
+    print(f"uncached   {args.requests / plain:8.1f} req/s")
+    print(f"cached     {args.requests / cached:8.1f} req/s  ({plain / cached:.1f}x)")
+    print(f"prediction hit rate {stats['predictions']['hit_rate']:.1%}, {stats['predictions']['size']} cached predictions, {stats['tokens']['size']} cached token lists")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+# padding waste and speed of classifying a realistic mix of text lengths in arrival order (padding=True, like the demo) vs with length buckets (classify_bucketed)
+# run from the chatbot_demo folder: python -m benchmarks.length_buckets --texts 512 --batch-size 32
+import argparse
+import time
+
+import torch
+
+from batching import buckets, classify_bucketed
+from benchmarks.models import load_classifier, make_mixed_sentences
+
+# fraction of the tokens the model processes that are just padding
+def pad_ratio(lengths: list, batches: list) -> float:
+    padded = sum(len(batch) * max(lengths[i] for i in batch) for batch in batches)
+    return 1 - sum(lengths) / padded
+
+def in_order(model, tokenizer, texts: list, batch_size: int) -> list:
+    results = []
+    for start in range(0, len(texts), batch_size):
+        batch = tokenizer(texts[start:start + batch_size], padding=True, truncation=True, max_length=512, return_tensors="pt")
+        with torch.no_grad():
+            results.extend(model(**batch).logits.argmax(dim=1).tolist())
+    return results
+
+def timed(function) -> tuple:
+    start = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", default="distilbert-base-uncased-finetuned-sst-2-english")
+    parser.add_argument("--texts", type=int, default=512)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--max-tokens", type=int, default=4096)
+    args = parser.parse_args()
+
+    tokenizer, model = load_classifier(args.model)
+    model.eval()
+    texts = make_mixed_sentences(args.texts)
+    lengths = [len(ids) for ids in tokenizer(texts, truncation=True, max_length=512)["input_ids"]]
+    in_order(model, tokenizer, texts[:8], 8) # warm up
+
+    arrival = [list(range(start, min(start + args.batch_size, len(texts)))) for start in range(0, len(texts), args.batch_size)]
+    plain, plain_time = timed(lambda: in_order(model, tokenizer, texts, args.batch_size))
+    print(f"{len(texts)} texts, {min(lengths)}-{max(lengths)} tokens (mean {sum(lengths) / len(lengths):.0f})")
+    print(f"{'batching':28} {'batches':>7} {'pad ratio':>9} {'seconds':>8} {'speedup':>8}")
+    print(f"{'arrival order':28} {len(arrival):7} {pad_ratio(lengths, arrival):9.1%} {plain_time:8.2f} {1:8.2f}x")
+
+    for label, max_tokens in [("length buckets", None), (f"buckets, {args.max_tokens} tokens max", args.max_tokens)]:
+        grouped = buckets(lengths, args.batch_size, max_tokens)
+        results, seconds = timed(lambda: classify_bucketed(model, tokenizer, texts, args.batch_size, max_tokens))
+        # same predictions, in the same order, as the plain run
+        matches = sum(model.config.label2id[result["label"]] == expected for result, expected in zip(results, plain))
+        print(f"{label:28} {len(grouped):7} {pad_ratio(lengths, grouped):9.1%} {seconds:8.2f} {plain_time / seconds:8.2f}x  ({matches}/{len(texts)} predictions match)")
+
+if __name__ == "__main__":
+    main()
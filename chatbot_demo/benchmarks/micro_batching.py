@@ -0,0 +1,74 @@
+# throughput and latency of the sentiment classifier with many concurrent callers, one forward pass per caller (the unbatched path) vs through BatchingClassifier
+# run from the chatbot_demo folder: python -m benchmarks.micro_batching --callers 32 --requests 512
+import argparse
+import threading
+import time
+
+import torch
+import torch.nn.functional as F
+
+from batching import BatchingClassifier
+from benchmarks.models import load_classifier, make_sentences
+
+def unbatched(model, tokenizer):
+    def classify(text):
+        batch = tokenizer([text], truncation=True, max_length=512, return_tensors="pt")
+        with torch.no_grad():
+            predictions = F.softmax(model(**batch).logits, dim=1)
+        score, label = predictions.max(dim=1)
+        return {"label": model.config.id2label[label.item()], "score": score.item()}
+    return classify
+
+# every caller sends its share of the sentences one after another, waiting for each answer (like a web request handler would)
+def run(classify, sentences: list, callers: int) -> tuple:
+    latencies = []
+    lock = threading.Lock()
+
+    def caller(share):
+        mine = []
+        for text in share:
+            start = time.perf_counter()
+            classify(text)
+            mine.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(mine)
+
+    threads = [threading.Thread(target=caller, args=(sentences[i::callers],)) for i in range(callers)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2]
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    return len(sentences) / elapsed, p50 * 1000, p99 * 1000
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", default="distilbert-base-uncased-finetuned-sst-2-english")
+    parser.add_argument("--callers", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=256)
+    parser.add_argument("--max-batch", type=int, default=32)
+    parser.add_argument("--max-wait-ms", type=float, default=5)
+    args = parser.parse_args()
+
+    tokenizer, model = load_classifier(args.model)
+    model.eval()
+    sentences = make_sentences(args.requests)
+    unbatched(model, tokenizer)("warm up")
+
+    print(f"{'path':10} {'callers':>7} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8}")
+    for callers in args.callers:
+        rate, p50, p99 = run(unbatched(model, tokenizer), sentences, callers)
+        print(f"{'unbatched':10} {callers:7} {rate:8.1f} {p50:8.1f} {p99:8.1f}")
+
+        batcher = BatchingClassifier(model, tokenizer, max_batch=args.max_batch, max_wait=args.max_wait_ms / 1000)
+        rate, p50, p99 = run(batcher, sentences, callers)
+        batcher.close()
+        print(f"{'batched':10} {callers:7} {rate:8.1f} {p50:8.1f} {p99:8.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+# models for the benchmarks: the real pretrained ones when the huggingface hub (or its local cache) has them, otherwise a model of the same architecture and size with random weights
+# NOTE: random weights give meaningless predictions, but every forward pass costs exactly the same, so timings still hold
+import os
+import random
+import tempfile
+
+# words the sample sentences are made of (and the whole vocabulary of the fallback tokenizer)
+WORDS = """i am loving this coffee the cat jumped over fence she enjoys reading mystery novels a gentle breeze cooled warm evening he practiced guitar for two hours
+coffee shop was bustling with activity glad that sens won last night hat tricks are rare what lucky numbers where do live my name is berlin game tonight
+highlights awful terrible pass goal refs were blind again honestly best period all season hello how you library salad sandwich lunch deciding between which healthier""".split()
+
+# a vocabulary file of the sample words, padded with filler tokens up to "size" entries (so a model's output layer can have its real size)
+def _vocab(size: int = 0) -> str:
+    words = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"] + sorted(set(WORDS))
+    words += [f"filler{i}" for i in range(size - len(words))]
+
+    folder = tempfile.mkdtemp()
+    path = os.path.join(folder, "vocab.txt")
+    with open(path, "w") as file:
+        file.write("\n".join(words))
+    return path
+
+# (tokenizer, model) for sequence classification
+def load_classifier(model_name: str = "distilbert-base-uncased-finetuned-sst-2-english"):
+    from transformers import AutoTokenizer, AutoModelForSequenceClassification
+
+    try:
+        return AutoTokenizer.from_pretrained(model_name), AutoModelForSequenceClassification.from_pretrained(model_name)
+    except OSError:
+        from transformers import DistilBertConfig, DistilBertForSequenceClassification, DistilBertTokenizerFast
+
+        print(f"Couldn't load {model_name}, using a model of the same size with random weights")
+        config = DistilBertConfig(id2label={0: "NEGATIVE", 1: "POSITIVE"}, label2id={"NEGATIVE": 0, "POSITIVE": 1})
+        return DistilBertTokenizerFast(vocab_file=_vocab()), DistilBertForSequenceClassification(config)
+
+# (tokenizer, model) of an NLI model, for zero-shot classification
+def load_nli(model_name: str = "typeform/distilbert-base-uncased-mnli"):
+    from transformers import AutoTokenizer, AutoModelForSequenceClassification
+
+    try:
+        return AutoTokenizer.from_pretrained(model_name), AutoModelForSequenceClassification.from_pretrained(model_name)
+    except OSError:
+        from transformers import DistilBertConfig, DistilBertForSequenceClassification, DistilBertTokenizerFast
+
+        print(f"Couldn't load {model_name}, using a model of the same size with random weights")
+        labels = ["ENTAILMENT", "NEUTRAL", "CONTRADICTION"]
+        config = DistilBertConfig(id2label=dict(enumerate(labels)), label2id={label: i for i, label in enumerate(labels)})
+        return DistilBertTokenizerFast(vocab_file=_vocab()), DistilBertForSequenceClassification(config)
+
+# (tokenizer, model) for extractive question answering
+def load_qa(model_name: str = "deepset/roberta-base-squad2"):
+    from transformers import AutoTokenizer, AutoModelForQuestionAnswering
+
+    try:
+        return AutoTokenizer.from_pretrained(model_name), AutoModelForQuestionAnswering.from_pretrained(model_name)
+    except OSError:
+        from transformers import BertConfig, BertForQuestionAnswering, BertTokenizerFast
+
+        print(f"Couldn't load {model_name}, using a model of the same size with random weights")
+        config = BertConfig() # 12 layers of 768, like roberta-base
+        return BertTokenizerFast(vocab_file=_vocab(), model_max_length=512), BertForQuestionAnswering(config)
+
+# (tokenizer, model) for text generation
+def load_generator(model_name: str = "distilgpt2"):
+    from transformers import AutoTokenizer, AutoModelForCausalLM
+
+    try:
+        return AutoTokenizer.from_pretrained(model_name), AutoModelForCausalLM.from_pretrained(model_name)
+    except OSError:
+        from transformers import BertTokenizerFast, GPT2Config, GPT2LMHeadModel
+
+        print(f"Couldn't load {model_name}, using a model of the same size with random weights")
+        config = GPT2Config(n_layer=6) # distilgpt2: gpt2 with 6 layers instead of 12
+        tokenizer = BertTokenizerFast(vocab_file=_vocab(config.vocab_size))
+        config.eos_token_id = config.bos_token_id = tokenizer.sep_token_id
+        return tokenizer, GPT2LMHeadModel(config)
+
+# sentences of 3 to "longest" words
+def make_sentences(count: int, longest: int = 30, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    return [" ".join(rng.choices(WORDS, k=rng.randint(3, longest))) for _ in range(count)]
+
+# a realistic mix of lengths: mostly short chat style sentences, some paragraphs and a few long texts
+def make_mixed_sentences(count: int, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    sentences = []
+    for _ in range(count):
+        kind = rng.random()
+        words = rng.randint(3, 15) if kind < 0.7 else rng.randint(15, 80) if kind < 0.95 else rng.randint(80, 400)
+        sentences.append(" ".join(rng.choices(WORDS, k=words)))
+    return sentences
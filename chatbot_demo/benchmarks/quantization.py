@@ -0,0 +1,71 @@
+# fp32 vs dynamic int8 (quantization.py) on a fixed set of sentences: model size, latency of one sentence, throughput in batches, and how often the int8 model agrees with the fp32 labels
+# run from the chatbot_demo folder: python -m benchmarks.quantization --sentences 512 --runs 3
+import argparse
+import io
+import statistics
+import tempfile
+import time
+
+import torch
+
+import fast_start
+from quantization import load_model, predict, save_quantized
+from benchmarks.models import load_classifier, make_sentences
+
+# bytes of the saved weights
+def size(model) -> int:
+    buffer = io.BytesIO()
+    torch.save(model.state_dict(), buffer)
+    return buffer.tell()
+
+def median_time(function, runs: int) -> float:
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", default="distilbert-base-uncased-finetuned-sst-2-english")
+    parser.add_argument("--sentences", type=int, default=512)
+    parser.add_argument("--batch", type=int, default=32)
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    tokenizer, model = load_classifier(args.model)
+    model.eval()
+
+    # NOTE: goes through the same quantize, save and load steps an app would, in a throwaway cache
+    fast_start.CACHE_DIR = tempfile.mkdtemp()
+    save_quantized(args.model, tokenizer, model)
+    _, quantized = load_model(args.model, quantized=True)
+
+    # NOTE: the sentences are generated from a fixed seed, so every run (and every machine) uses the same set
+    sentences = make_sentences(args.sentences, seed=0)
+    batches = [sentences[i:i + args.batch] for i in range(0, len(sentences), args.batch)]
+
+    results = {}
+    for name, variant in [("fp32", model), ("int8", quantized)]:
+        predict(variant, tokenizer, sentences[:args.batch]) # warm up
+        latency = median_time(lambda: [predict(variant, tokenizer, [sentence]) for sentence in sentences[:50]], args.runs) / 50
+        batched = median_time(lambda: [predict(variant, tokenizer, batch) for batch in batches], args.runs)
+        results[name] = {
+            "size": size(variant),
+            "latency": latency,
+            "throughput": len(sentences) / batched,
+            "predictions": [prediction for batch in batches for prediction in predict(variant, tokenizer, batch)],
+        }
+
+    fp32, int8 = results["fp32"]["predictions"], results["int8"]["predictions"]
+    agreement = sum(a["label"] == b["label"] for a, b in zip(fp32, int8)) / len(fp32)
+    score_gap = max(abs(a["score"] - b["score"]) for a, b in zip(fp32, int8))
+
+    print(f"{len(sentences)} sentences, batches of {args.batch}, {torch.get_num_threads()} threads, median of {args.runs} runs")
+    for name, result in results.items():
+        print(f"{name}  size {result['size'] / 1e6:6.1f} MB   latency {result['latency'] * 1000:6.1f} ms   throughput {result['throughput']:6.1f} sentences/s")
+    print(f"int8 agrees with fp32 on {agreement:.1%} of the labels (largest score difference {score_gap:.3f})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+# many questions about one long document: the question-answering pipeline called once per question (like main.py), the pipeline given every question at once with batch_size, and qa.QuestionAnswerer
+# run from the chatbot_demo folder: python -m benchmarks.question_answering --questions 16 --words 1500
+import argparse
+import random
+import time
+
+from transformers import pipeline
+
+from qa import QuestionAnswerer
+from benchmarks.models import WORDS, load_qa
+
+def timed(function):
+    start = time.perf_counter()
+    result = function()
+    return time.perf_counter() - start, result
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", default="deepset/roberta-base-squad2")
+    parser.add_argument("--questions", type=int, default=16)
+    parser.add_argument("--words", type=int, default=1500)
+    parser.add_argument("--batch", type=int, default=16)
+    args = parser.parse_args()
+
+    tokenizer, model = load_qa(args.model)
+    oracle = pipeline("question-answering", model=model, tokenizer=tokenizer)
+
+    rng = random.Random(0)
+    document = ". ".join(" ".join(rng.choices(WORDS, k=12)) for _ in range(args.words // 12)) + "."
+    questions = [{"question": " ".join(rng.choices(WORDS, k=rng.randint(4, 10))) + "?", "context": document} for _ in range(args.questions)]
+
+    answerer = QuestionAnswerer(model, tokenizer, batch_size=args.batch)
+    windows = len(answerer._windows(tokenizer(questions[0]["question"], add_special_tokens=False)["input_ids"], answerer.context(document)))
+    oracle(questions[0]) # warm up
+
+    per_question, expected = timed(lambda: [oracle(item) for item in questions])
+    listed, _ = timed(lambda: oracle(questions, batch_size=args.batch))
+    answerer.contexts.clear() # NOTE: timed including tokenizing the document
+    batched, results = timed(lambda: answerer(questions))
+
+    same = sum((a["start"], a["end"]) == (b["start"], b["end"]) for a, b in zip(expected, results)) / len(questions)
+    gap = max(abs(a["score"] - b["score"]) for a, b in zip(expected, results))
+
+    print(f"{len(questions)} questions about a document of {len(answerer.context(document).ids)} tokens ({windows} windows per question)")
+    print(f"pipeline, one call per question      {per_question:6.2f}s")
+    print(f"pipeline, all questions, batch {args.batch:<4}  {listed:6.2f}s")
+    print(f"QuestionAnswerer, batch {args.batch:<4}         {batched:6.2f}s")
+    print(f"same answer as the pipeline for {same:.0%} of the questions (largest score difference {gap:.2e})")
+
+if __name__ == "__main__":
+    main()
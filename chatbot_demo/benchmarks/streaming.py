@@ -0,0 +1,60 @@
+# time to first token with TokenStream vs waiting for the whole answer like generator(...) does, plus how quickly cancel() and max_time stop a generation
+# run from the chatbot_demo folder: python -m benchmarks.streaming --tokens 50 --runs 3
+import argparse
+import statistics
+import threading
+import time
+
+import torch
+
+from streaming import TokenStream
+from benchmarks.models import load_generator
+
+PROMPT = "For lunch, I am deciding between a salad and a sandwich. Which is healthier?"
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", default="distilgpt2")
+    parser.add_argument("--tokens", type=int, default=50)
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    tokenizer, model = load_generator(args.model)
+    model.eval()
+    inputs = tokenizer(PROMPT, return_tensors="pt")
+    # NOTE: min_new_tokens keeps a random model from stopping early, so every run does the same amount of work
+    settings = {"max_new_tokens": args.tokens, "min_new_tokens": args.tokens, "do_sample": False}
+    model.generate(**inputs, max_new_tokens=2, pad_token_id=tokenizer.pad_token_id) # warm up
+
+    blocking = []
+    for _ in range(args.runs):
+        start = time.perf_counter()
+        with torch.no_grad():
+            model.generate(**inputs, pad_token_id=tokenizer.pad_token_id, **settings)
+        blocking.append(time.perf_counter() - start)
+
+    first, total = [], []
+    for _ in range(args.runs):
+        stream = TokenStream(model, tokenizer, PROMPT, max_new_tokens=args.tokens, min_new_tokens=args.tokens, do_sample=False)
+        for _ in stream:
+            pass
+        first.append(stream.time_to_first_token)
+        total.append(stream.elapsed)
+
+    # cancel from another thread after 0.5s, and a 0.5s max_time budget
+    stream = TokenStream(model, tokenizer, PROMPT, max_new_tokens=1000, min_new_tokens=1000)
+    threading.Timer(0.5, stream.cancel).start()
+    cancelled = sum(1 for _ in stream)
+    cancel_time = stream.elapsed
+
+    stream = TokenStream(model, tokenizer, PROMPT, max_new_tokens=1000, min_new_tokens=1000, max_time=0.5)
+    budget = sum(1 for _ in stream)
+
+    print(f"{args.tokens} new tokens, median of {args.runs} runs")
+    print(f"blocking generate     first text after {statistics.median(blocking):6.2f}s (the whole answer at once)")
+    print(f"TokenStream           first text after {statistics.median(first):6.2f}s, whole answer after {statistics.median(total):.2f}s")
+    print(f"cancel() after 0.5s   stopped after {cancel_time:.2f}s ({cancelled} pieces)")
+    print(f"max_time=0.5          stopped after {stream.elapsed:.2f}s ({budget} pieces)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+# tagging many texts against the same labels: the zero-shot pipeline called once per text (like main.py), the pipeline given every text at once with batch_size, and zero_shot.ZeroShotClassifier
+# run from the chatbot_demo folder: python -m benchmarks.zero_shot --texts 100 --labels 20
+import argparse
+import time
+
+from transformers import pipeline
+
+from zero_shot import ZeroShotClassifier
+from benchmarks.models import load_nli, make_sentences
+
+LABELS = ["hockey", "football", "baseball", "coffee", "food", "music", "books", "weather", "travel", "politics",
+          "movies", "school", "work", "money", "health", "family", "games", "pets", "shopping", "technology"]
+
+def timed(function):
+    start = time.perf_counter()
+    result = function()
+    return time.perf_counter() - start, result
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", default="typeform/distilbert-base-uncased-mnli")
+    parser.add_argument("--texts", type=int, default=100)
+    parser.add_argument("--labels", type=int, default=20)
+    parser.add_argument("--batch", type=int, default=64)
+    args = parser.parse_args()
+
+    tokenizer, model = load_nli(args.model)
+    zero = pipeline("zero-shot-classification", model=model, tokenizer=tokenizer)
+    texts = make_sentences(args.texts, seed=0)
+    labels = LABELS[:args.labels]
+
+    classifier = ZeroShotClassifier(model, tokenizer, labels, batch_size=args.batch)
+    classifier(texts[:4]) # warm up
+
+    per_text, expected = timed(lambda: [zero(text, candidate_labels=labels) for text in texts])
+    listed, _ = timed(lambda: zero(texts, candidate_labels=labels, batch_size=args.batch))
+    batched, results = timed(lambda: classifier(texts))
+
+    gap = max(abs(a["scores"][a["labels"].index(label)] - b["scores"][b["labels"].index(label)]) for a, b in zip(expected, results) for label in labels)
+
+    print(f"{len(texts)} texts x {len(labels)} labels = {len(texts) * len(labels)} pairs")
+    print(f"pipeline, one call per text       {per_text:6.2f}s  {len(texts) / per_text:7.1f} texts/s")
+    print(f"pipeline, all texts, batch {args.batch:<4}   {listed:6.2f}s  {len(texts) / listed:7.1f} texts/s")
+    print(f"ZeroShotClassifier, batch {args.batch:<4}    {batched:6.2f}s  {len(texts) / batched:7.1f} texts/s")
+    # NOTE: compared label by label, since labels with (almost) equal scores can come back in either order
+    print(f"largest difference from the pipeline's scores: {gap:.2e}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+import copy
+import hashlib
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+
+import torch
+
+from batching import to_predictions
+
+# caches for inputs that keep coming back (canned replies, "thanks!", "lol", ...), so they are only tokenized and run through the model once
+# two levels:
+#   token ids     text -> ids from tokenizer.tokenize + convert_tokens_to_ids. Saves the tokenizer work, and is still useful when a prediction was evicted or the same text is used with other settings
+#   predictions   text -> the final result. A hit skips the tokenizer and the model completely
+# NOTE: keys are a hash of the normalized text together with the model name and the settings that change the result (ex. max_length), so two models or two configurations can never hand each other their results
+
+
+# text as the model would see it, so trivially different copies share one cache entry
+# NOTE: only changes that can't change the prediction are made: unicode forms are unified, runs of whitespace become one space, and the text is lowercased only for tokenizers that lowercase everything anyway
+def normalize(text: str, lowercase: bool = False) -> str:
+    text = re.sub(r"\s+", " ", unicodedata.normalize("NFC", text)).strip()
+    return text.lower() if lowercase else text
+
+
+class LRUCache:
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict() # key -> value, least recently used first
+        self._lock = threading.Lock()
+
+    # the value for key, or None
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value) -> None:
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / total if total else 0.0, "size": len(self._entries), "max_entries": self.max_entries}
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+
+# the token id and prediction caches for one model
+class InferenceCache:
+    def __init__(self, model_name: str, max_tokens: int = 50000, max_predictions: int = 10000, lowercase: bool = False):
+        self.model_name = model_name
+        self.lowercase = lowercase # see normalize()
+        self.tokens = LRUCache(max_tokens)
+        self.predictions = LRUCache(max_predictions)
+
+    def key(self, text: str, settings: dict = None) -> str:
+        settings = "" if not settings else repr(sorted(settings.items()))
+        return hashlib.sha256(f"{self.model_name}\0{settings}\0{normalize(text, self.lowercase)}".encode("utf-8")).hexdigest()
+
+    # token ids of text (without special tokens), tokenizing it only on a miss
+    def token_ids(self, tokenizer, text: str) -> list:
+        # NOTE: token ids don't depend on settings like max_length (truncation happens later), so they are shared by every configuration
+        key = self.key(text)
+        ids = self.tokens.get(key)
+        if ids is None:
+            ids = tokenizer.convert_tokens_to_ids(tokenizer.tokenize(normalize(text, self.lowercase)))
+            self.tokens.put(key, ids)
+        return ids
+
+    def stats(self) -> dict:
+        return {"tokens": self.tokens.stats(), "predictions": self.predictions.stats()}
+
+
+# the manual tokenizer/model path from main.py, with both cache levels in front of it
+class CachedClassifier:
+    def __init__(self, model, tokenizer, model_name: str, max_length: int = 512, cache: InferenceCache = None):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.max_length = max_length
+        self.settings = {"max_length": max_length}
+        self.cache = cache or InferenceCache(model_name, lowercase=getattr(tokenizer, "do_lower_case", False))
+        self.model.eval()
+
+    # {"label": ..., "score": ...} for every text, in order. Only the texts without a cached prediction go through the model (as one batch)
+    def __call__(self, texts: list) -> list:
+        keys = [self.cache.key(text, self.settings) for text in texts]
+        results = [self.cache.predictions.get(key) for key in keys]
+
+        missing = [position for position, result in enumerate(results) if result is None]
+        if missing:
+            # NOTE: the same text can be in one call twice, but only needs to run once
+            unique = list(dict.fromkeys(keys[position] for position in missing))
+            texts_by_key = {keys[position]: texts[position] for position in missing}
+
+            # cached ids, plus the special tokens ([CLS], [SEP]) and truncation the tokenizer would have added
+            encoded = [self.tokenizer.prepare_for_model(self.cache.token_ids(self.tokenizer, texts_by_key[key]), truncation=True, max_length=self.max_length) for key in unique]
+            batch = self.tokenizer.pad(encoded, return_tensors="pt")
+            with torch.no_grad():
+                predictions = to_predictions(self.model, self.model(**batch).logits)
+
+            computed = {}
+            for key, prediction in zip(unique, predictions):
+                computed[key] = prediction
+                self.cache.predictions.put(key, prediction)
+            for position in missing:
+                results[position] = computed[keys[position]]
+
+        # NOTE: callers get copies, so changing a result can't change what's cached
+        return [dict(result) for result in results]
+
+
+# any pipeline (ex. pipeline("sentiment-analysis")) with a prediction cache in front of it
+# NOTE: pipelines tokenize internally, so only the prediction level applies here. Keyword arguments (ex. candidate_labels) are part of the key
+class CachedPipeline:
+    def __init__(self, pipe, max_predictions: int = 10000, cache: InferenceCache = None):
+        self._fetch = lambda: pipe
+        self.max_predictions = max_predictions
+        self.cache = cache # made from the pipeline's model on the first call when not given
+
+    # a cache in front of a pipeline from a PipelineRegistry (see pipelines.py)
+    # NOTE: the pipeline is looked up in the registry on every call instead of being kept here, so the registry can still unload its model. Cached predictions stay, and a call after an unload builds the pipeline again
+    @classmethod
+    def from_registry(cls, registry, name: str, **kwargs) -> "CachedPipeline":
+        cached = cls(None, **kwargs)
+        cached._fetch = lambda: registry[name]
+        return cached
+
+    @property
+    def pipe(self):
+        return self._fetch()
+
+    def __call__(self, inputs, **kwargs):
+        single = isinstance(inputs, str)
+        texts = [inputs] if single else list(inputs)
+
+        if self.cache is None:
+            pipe = self.pipe
+            self.cache = InferenceCache(pipe.model.name_or_path, max_predictions=self.max_predictions, lowercase=getattr(pipe.tokenizer, "do_lower_case", False))
+
+        keys = [self.cache.key(text, kwargs) for text in texts]
+        results = [self.cache.predictions.get(key) for key in keys]
+
+        missing = [position for position, result in enumerate(results) if result is None]
+        if missing:
+            outputs = self.pipe([texts[position] for position in missing], **kwargs)
+            for position, output in zip(missing, outputs):
+                self.cache.predictions.put(keys[position], output)
+                results[position] = output
+
+        results = copy.deepcopy(results)
+        return results[0] if single else results
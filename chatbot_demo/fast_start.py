@@ -0,0 +1,74 @@
+# a quick starting classifier for short lived jobs: python fast_start.py "I am loving this coffee"
+# first save a model to a local folder once: python fast_start.py --export distilbert-base-uncased-finetuned-sst-2-english
+# NOTE: a normal start (like main.py) pays for three things before the first prediction:
+#   1. importing torch and transformers (seconds), even when the job ends up having nothing to classify
+#   2. from_pretrained with a hub name: network requests to the hub to check for a newer version of the model, before anything is loaded
+#   3. weights saved as pytorch_model.bin are unpickled, ie. read and copied into every process's own memory
+# here:
+#   1. nothing heavy is imported until the first prediction is actually asked for
+#   2. the model is loaded from a local folder, so the hub is never contacted
+#   3. the weights are saved as safetensors, which transformers memory maps instead of reading. The parameters point straight into the file (benchmarks/cold_start.py checks this), only the pages the model touches are read, and those pages live in the OS page cache once, shared by every process using the model (including workers forked from a warm parent)
+import os
+import sys
+
+# where exported models live (one folder per model)
+CACHE_DIR = os.environ.get("CHATBOT_MODEL_CACHE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "model_cache"))
+
+def local_folder(model_name: str) -> str:
+    return os.path.join(CACHE_DIR, model_name.replace("/", "--"))
+
+# save a model (and its tokenizer) as safetensors into the local cache. Only needs to happen once
+def export(model_name: str, tokenizer=None, model=None) -> str:
+    from transformers import AutoTokenizer, AutoModelForSequenceClassification
+
+    folder = local_folder(model_name)
+    tokenizer = tokenizer or AutoTokenizer.from_pretrained(model_name)
+    model = model or AutoModelForSequenceClassification.from_pretrained(model_name)
+    tokenizer.save_pretrained(folder)
+    model.save_pretrained(folder, safe_serialization=True)
+    return folder
+
+
+# a sequence classifier loaded from the local cache the first time it's used
+class MappedClassifier:
+    def __init__(self, model_name: str, max_length: int = 512):
+        self.model_name = model_name
+        self.folder = local_folder(model_name)
+        self.max_length = max_length
+        self.tokenizer = None
+        self.model = None
+
+    def load(self) -> None:
+        if self.model is not None:
+            return
+
+        from transformers import AutoTokenizer, AutoModelForSequenceClassification
+
+        self.tokenizer = AutoTokenizer.from_pretrained(self.folder)
+        # NOTE: use_safetensors makes sure this never falls back to unpickling a .bin copy of the weights
+        self.model = AutoModelForSequenceClassification.from_pretrained(self.folder, use_safetensors=True).eval()
+
+    # {"label": ..., "score": ...} for every text
+    def __call__(self, texts: list) -> list:
+        self.load()
+
+        import torch
+        from batching import to_predictions
+
+        batch = self.tokenizer(texts, padding=True, truncation=True, max_length=self.max_length, return_tensors="pt")
+        with torch.no_grad():
+            return to_predictions(self.model, self.model(**batch).logits)
+
+
+if __name__ == "__main__":
+    model_name = os.environ.get("CHATBOT_MODEL", "distilbert-base-uncased-finetuned-sst-2-english")
+
+    if sys.argv[1:2] == ["--export"]:
+        print(f"Saved to {export(sys.argv[2] if len(sys.argv) > 2 else model_name)}")
+    elif not os.path.isdir(local_folder(model_name)):
+        print(f"{model_name} isn't in {CACHE_DIR} yet, run: python fast_start.py --export {model_name}")
+    else:
+        texts = sys.argv[1:]
+        if texts: # NOTE: nothing to classify means torch never even gets imported
+            for text, result in zip(texts, MappedClassifier(model_name)(texts)):
+                print(f"{result['label']} ({result['score']:.3f}): {text}")
@@ -1,45 +1,80 @@
 # pipelines abstract complex logic, making it easy to apply an LLP task
-from transformers import pipeline 
+import os
+
+from pipelines import PipelineRegistry
 
 # NOTE: this is a good doc resource for pipeline tasks
 # https://huggingface.co/docs/transformers/main/en/main_classes/pipelines#transformers.pipeline.task
 
+# NOTE: short lived jobs that only need the sentiment classifier should use fast_start.py instead, which doesn't import torch or transformers until the first prediction and loads the model from a local safetensors copy
+# NOTE: every pipeline below loads a whole model into memory. Rather than building all of them up front, the registry builds each one the first time it's used, and unloads the least recently used ones once the models go over the memory budget (PIPELINE_BUDGET_MB)
+pipelines = PipelineRegistry(budget_mb=float(os.environ.get("PIPELINE_BUDGET_MB", "2048")))
+
 # NOTE: there are a ton of tasks available to pass as a string to the pipeline object
-classifier = pipeline("sentiment-analysis")
-result_1 = classifier("I am loving this coffee")
-# print(result_1)
+pipelines.register("classifier", "sentiment-analysis")
 
 # NOTE: there are also tons of models you can apply to a pipeline
-generator = pipeline("text-generation", model="distilgpt2")
-result_2 = generator("For lunch, I am deciding between a salad and a sandwich. Which is healthier?", num_return_sequences=2)
-# print(result_2)
+pipelines.register("generator", "text-generation", model="distilgpt2")
 
 # NOTE: this task will try to find what category fits best
-zero = pipeline("zero-shot-classification")
-result_3 = zero("hat tricks are rare", candidate_labels=["football", "hockey", "baseball"])
-# print(result_3)
+pipelines.register("zero", "zero-shot-classification")
 
 # NOTE: some pipelines and models can be provided multiple questions and process multiple answers
-oracle = pipeline(model="deepset/roberta-base-squad2")
+pipelines.register("oracle", model="deepset/roberta-base-squad2")
+
+pipelines.register("lucky", "question-answering")
+pipelines.register("en_to_fr", "translation_en_to_fr")
+
+# NOTE: pipelines are used straight from the registry rather than kept in variables. A variable would keep a model in memory even after the registry unloaded it
+result_1 = pipelines["classifier"]("I am loving this coffee")
+# print(result_1)
+
+result_2 = pipelines["generator"]("For lunch, I am deciding between a salad and a sandwich. Which is healthier?", num_return_sequences=2)
+# print(result_2)
+
+# the generator above only returns once the whole answer is written. a TokenStream hands over each piece of text as soon as it's generated, so a chat can show the first words almost right away (see streaming.py for using it from flask or socket.io)
+# from streaming import TokenStream
+# stream = TokenStream.from_pipeline(pipelines["generator"], "For lunch, I am deciding between a salad and a sandwich. Which is healthier?", max_new_tokens=50, max_time=5)
+# for piece in stream:
+#     print(piece, end="", flush=True)
+# print(stream.time_to_first_token, stream.elapsed)
+# NOTE: python -m benchmarks.streaming compares this to waiting for the whole answer. on one cpu the first text shows up after about 0.1s instead of 2s
+
+result_3 = pipelines["zero"]("hat tricks are rare", candidate_labels=["football", "hockey", "baseball"])
+# print(result_3)
+
+# the pipeline runs one (text, "This example is hockey.") pair through the model per label, and tokenizes every hypothesis again on every call. a ZeroShotClassifier tokenizes the hypotheses once for a fixed set of labels, and runs the pairs of many texts together in batches
+# from zero_shot import ZeroShotClassifier
+# topics = ZeroShotClassifier.from_pipeline(pipelines["zero"], ["football", "hockey", "baseball"])
+# print(topics(["hat tricks are rare", "what a home run", "the refs were blind again"]))
+# NOTE: python -m benchmarks.zero_shot tags 100 texts with 20 labels. it's about 2.5x faster than calling the pipeline once per text, and about 1.35x faster than giving the pipeline every text at once, with the same scores
+
 questions = [
     {"question": "Where do I live?", "context": "My name is Wolfgang and I live in Berlin"},
     {"question": "What is my name?", "context": "My name is Wolfgang and I live in Berlin"},
 ]
-result_4 = [oracle(q) for q in questions]
+result_4 = [pipelines["oracle"](q) for q in questions]
 # print(result_4) 
 # results with start and end JSON keys will be applied to where the model predicts the main keywords in the question lie to give way to the answer. so the answer to the first question is:
 # {'score': 0.9190714955329895, 'start': 34, 'end': 40, 'answer': 'Berlin'}
 # in the question, Berlin string starts at string index 34 and ends at 40. The algorithm tells you where it found its answer via the question 
 
-lucky = pipeline("question-answering")
-result_5 = lucky(question="what are my lucky numbers", context="1, 2, 3 are numbers i find to be lucky, but i find that 7 is unlucky")
+# the list above calls the pipeline once per question, and every call tokenizes the context again. a QuestionAnswerer tokenizes each context once and runs the questions together in batches. a long context is cut into overlapping windows the model can take (max_length tokens each, neighbours sharing "stride" tokens)
+# from qa import QuestionAnswerer
+# answerer = QuestionAnswerer.from_pipeline(pipelines["oracle"], max_length=384, stride=128)
+# print(answerer(questions)) # the same {'score', 'start', 'end', 'answer'} dicts as result_4
+# NOTE: python -m benchmarks.question_answering asks 16 questions about one 1600 token document. the model still has to read every window once per question, so on one cpu it's only a few percent faster, and gives exactly the pipeline's answers
+
+result_5 = pipelines["lucky"](question="what are my lucky numbers", context="1, 2, 3 are numbers i find to be lucky, but i find that 7 is unlucky")
 # print(result_5)
 
 
-en_to_fr = pipeline("translation_en_to_fr")
-result_6 = en_to_fr("Hello, how are you? Where is the library?")
+result_6 = pipelines["en_to_fr"]("Hello, how are you? Where is the library?")
 # print(result_6)
 
+# which pipelines are still loaded, and how much memory their models take
+# print(pipelines.loaded(), pipelines.used() / 1e6, "MB")
+
 
 
 # tokenizers are essentially the ML algorithms way of shaping a string/question into a mathematical expression that it can understand. modifying tokenizers gives more customization into how ML can be integrated in a program.
@@ -54,9 +89,17 @@ model_name = "distilbert-base-uncased-finetuned-sst-2-english"
 # this is a toxic comment classification model
 # model_name = "JungleLee/bert-toxic-comment-classification"
 
-model = AutoModelForSequenceClassification.from_pretrained(model_name)
+# on a cpu only host, CHATBOT_QUANTIZE=1 swaps in an int8 copy of the model: its linear layers use 8 bit integer weights instead of 32 bit floats. everything below works the same with either one
+# NOTE: the int8 copy is made once and kept in the local model cache (see quantization.py). python -m benchmarks.quantization measures about 3x the sentences per second and half the size, with almost every label unchanged
+# NOTE: which model to use is decided before loading anything, so the int8 path doesn't read the fp32 weights as well (only the very first time, to make the int8 copy)
+if os.environ.get("CHATBOT_QUANTIZE") == "1":
+    from quantization import load_model
+
+    tokenizer, model = load_model(model_name, quantized=True)
+else:
+    model = AutoModelForSequenceClassification.from_pretrained(model_name)
 
-tokenizer = AutoTokenizer.from_pretrained(model_name)
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
 
 tokens = tokenizer.tokenize("I am glad that the Sens won last night") # each word is separated as a string and assigned a token 
 
@@ -105,4 +148,39 @@ with torch.no_grad():
     assurance = [model.config.id2label[label_id] for label_id in labels.tolist()]
     print(assurance)
     # assurance: the actual results of what each sentence is
-    # ['POSITIVE', 'POSITIVE', 'POSITIVE', 'NEGATIVE', 'POSITIVE']
\ No newline at end of file
+    # ['POSITIVE', 'POSITIVE', 'POSITIVE', 'NEGATIVE', 'POSITIVE']
+
+
+# NOTE: padding=True pads every sentence to the longest one in the batch, so a single long text makes the model chew through mostly padding. classify_bucketed groups texts of similar length and pads each group only to its own longest text (results stay in the original order)
+# with a realistic mix of short and long texts this is several times faster (see python -m benchmarks.length_buckets)
+from batching import classify_bucketed
+
+print(classify_bucketed(model, tokenizer, sentences, batch_size=32))
+# [{'label': 'POSITIVE', 'score': 0.539...}, {'label': 'POSITIVE', 'score': 0.999...}, ...]
+
+# so far the batches were put together by hand. when many callers each have one sentence (ex. requests to a web server), a BatchingClassifier groups them into batches automatically: every caller gets a future, and the model runs once per batch instead of once per sentence
+from batching import BatchingClassifier
+
+batcher = BatchingClassifier(model, tokenizer, max_batch=32, max_wait=0.005, max_tokens=4096) # a batch runs once 32 sentences are waiting, or 5ms after the first one arrived. max_tokens splits it into length buckets like classify_bucketed
+futures = [batcher.submit(sentence) for sentence in sentences]
+print([future.result() for future in futures])
+# [{'label': 'POSITIVE', 'score': 0.539...}, {'label': 'POSITIVE', 'score': 0.999...}, ...]
+# NOTE: python -m benchmarks.micro_batching compares this to one forward pass per sentence. on one cpu with 32 callers at once it roughly doubles the sentences per second and halves the latency
+
+batcher.close()
+
+
+# lots of chat traffic repeats itself ("lol", "thanks!", canned replies). a CachedClassifier keeps the token ids and the final prediction of recent texts, so a repeated text skips the tokenizer and the model completely
+# NOTE: texts are normalized first (whitespace, unicode and, for uncased models, upper/lower case), so "  Thanks! " and "thanks!" share one entry. the model name and max_length are part of the key too
+from cache import CachedClassifier, CachedPipeline
+
+cached_classifier = CachedClassifier(model, tokenizer, model_name)
+print(cached_classifier(sentences))
+print(cached_classifier(sentences)) # every sentence is a cache hit this time
+print(cached_classifier.cache.stats())
+# {'tokens': {'hits': 0, 'misses': 5, ...}, 'predictions': {'hits': 5, 'misses': 5, 'hit_rate': 0.5, 'size': 5, 'max_entries': 10000}}
+
+# pipelines can be cached the same way (keyword arguments, like candidate_labels, are part of the key). from_registry looks the pipeline up in the registry on every call, so the cache doesn't keep the model in memory after the registry unloaded it
+cached_sentiment = CachedPipeline.from_registry(pipelines, "classifier")
+print(cached_sentiment("I am loving this coffee"), cached_sentiment("i am   LOVING this coffee"))
+# NOTE: python -m benchmarks.inference_cache measures this on traffic where 80% of the texts come from 300 common phrases: about 3x the requests per second
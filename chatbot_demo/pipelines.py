@@ -0,0 +1,99 @@
+import threading
+from collections import OrderedDict
+
+# builds pipelines the first time they are asked for, and keeps the total memory of the loaded models under a budget
+# NOTE: building a pipeline downloads (the first time) and loads its whole model into RAM, which takes seconds and hundreds of MB per model. A process that only ever needs one task shouldn't pay for all of them
+# NOTE: once the budget is exceeded, the pipelines that were used least recently are dropped until everything fits again (ie. an LRU cache). Asking for a dropped pipeline later simply builds it again
+
+# bytes held by a model's weights (parameters and buffers). This is what dominates a pipeline's memory
+def model_bytes(pipe) -> int:
+    model = pipe.model
+    tensors = list(model.parameters()) + list(model.buffers())
+    return sum(tensor.numel() * tensor.element_size() for tensor in tensors)
+
+
+class PipelineRegistry:
+    def __init__(self, budget_mb: float = 2048):
+        self.budget = int(budget_mb * 1e6) # bytes the loaded models may use together
+        self._specs = {} # name -> keyword arguments for pipeline()
+        self._loaded = OrderedDict() # name -> (pipeline, bytes), least recently used first
+        self._lock = threading.Lock() # guards _loaded and _building, only ever held for a moment
+        self._building = {} # name -> lock held while that pipeline is being built
+
+    # describe a pipeline without building it (takes the same arguments as transformers.pipeline)
+    def register(self, name: str, task: str = None, **kwargs) -> None:
+        self._specs[name] = {"task": task, **kwargs}
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._specs
+
+    # the pipeline called name, built now if it isn't loaded
+    def get(self, name: str):
+        pipe = self._lookup(name)
+        if pipe is not None:
+            return pipe
+
+        if name not in self._specs:
+            raise KeyError(f"No pipeline registered as {name!r}")
+
+        # NOTE: building takes seconds, so it only holds this pipeline's own lock. Two threads asking for the same pipeline never load the model twice, while everyone else (including callers of pipelines that are already loaded) carries on
+        with self._lock:
+            building = self._building.setdefault(name, threading.Lock())
+
+        with building:
+            # another thread may have finished building it while this one waited
+            pipe = self._lookup(name)
+            if pipe is not None:
+                return pipe
+
+            # NOTE: transformers (and torch with it) is only imported once a pipeline is first needed, so a process that never uses one starts instantly
+            from transformers import pipeline
+
+            pipe = pipeline(**self._specs[name])
+            size = model_bytes(pipe)
+
+            with self._lock:
+                self._loaded[name] = (pipe, size)
+                self._evict(keep=name)
+            return pipe
+
+    # the loaded pipeline called name (marked as just used), or None
+    def _lookup(self, name: str):
+        with self._lock:
+            if name not in self._loaded:
+                return None
+            self._loaded.move_to_end(name)
+            return self._loaded[name][0]
+
+    def __getitem__(self, name: str):
+        return self.get(name)
+
+    # NOTE: called with the lock held
+    def _evict(self, keep: str):
+        while self._used() > self.budget and len(self._loaded) > 1:
+            name = next(iter(self._loaded))
+            _, size = self._loaded.pop(name)
+            print(f"Unloaded pipeline {name!r} ({size / 1e6:.0f} MB) to stay under the {self.budget / 1e6:.0f} MB budget")
+
+        # NOTE: a single model bigger than the whole budget is still loaded (everything else has been dropped for it)
+        if self._used() > self.budget:
+            print(f"Pipeline {keep!r} alone is over the {self.budget / 1e6:.0f} MB budget")
+
+    # drop a pipeline now (ex. a task that won't be needed again)
+    def unload(self, name: str) -> None:
+        with self._lock:
+            self._loaded.pop(name, None)
+
+    # bytes used by the loaded models
+    # NOTE: this counts what the registry holds. A caller that still has a reference to a dropped pipeline keeps its memory alive until it lets go of it
+    def used(self) -> int:
+        with self._lock:
+            return self._used()
+
+    def _used(self) -> int:
+        return sum(size for _, size in self._loaded.values())
+
+    # names of the loaded pipelines, least recently used first
+    def loaded(self) -> list:
+        with self._lock:
+            return list(self._loaded)
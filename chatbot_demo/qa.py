@@ -0,0 +1,157 @@
+import torch
+
+from batching import buckets, pad_batch
+from cache import LRUCache
+
+# extractive question answering for many questions about the same (possibly long) text
+# NOTE: the question-answering pipeline handles one question at a time: it tokenizes the question together with the whole context, splits the result into windows the model can take, and runs them. Ten questions about one document tokenize that document ten times, in ten separate rounds of forward passes
+# here:
+#   each context is tokenized once (and recent ones are kept, so asking about the same document again skips that step)
+#   each question is tokenized on its own and combined with the context's ids, window by window
+#   the windows of all the questions are run together, in batches of similar length (see batching.buckets)
+# NOTE: a long context is cut into windows of up to max_length tokens (question and special tokens included). Neighbouring windows share "stride" tokens, so an answer that sits on the edge of one window is whole in the next one
+# results are the same as the pipeline's: {"score": ..., "start": ..., "end": ..., "answer": ...}, with start and end as character positions in the context
+# NOTE: written for fast tokenizers of models that read the question first (bert, roberta, distilbert, ...), which is what the pipeline uses for them too
+
+
+# a context tokenized once: its token ids, and where each token came from in the text
+class _Context:
+    def __init__(self, tokenizer, text: str):
+        self.text = text
+        # NOTE: verbose=False because a context longer than the model can take is expected here (that is what the windows are for)
+        self.encoding = tokenizer(text, add_special_tokens=False, return_offsets_mapping=True, verbose=False)[0]
+        self.ids = self.encoding.ids
+
+    # (start, end) characters of the answer from token "first" to token "last", stretched to whole words like the pipeline does
+    def span(self, first: int, last: int) -> tuple:
+        try:
+            return self.encoding.word_to_chars(self.encoding.token_to_word(first))[0], self.encoding.word_to_chars(self.encoding.token_to_word(last))[1]
+        except Exception:
+            return self.encoding.offsets[first][0], self.encoding.offsets[last][1]
+
+
+class QuestionAnswerer:
+    def __init__(self, model, tokenizer, max_length: int = None, stride: int = None, max_answer_length: int = 15, batch_size: int = 16, max_tokens: int = None, handle_impossible_answer: bool = False, max_contexts: int = 8):
+        self.model = model.eval()
+        self.tokenizer = tokenizer
+        # the pipeline's defaults
+        self.max_length = max_length or min(tokenizer.model_max_length, 384)
+        self.stride = stride if stride is not None else min(self.max_length // 2, 128)
+        self.max_answer_length = max_answer_length # tokens
+        self.batch_size = batch_size # windows per forward pass
+        self.max_tokens = max_tokens # padded tokens per forward pass (see batching.buckets)
+        self.handle_impossible_answer = handle_impossible_answer # allow "no answer" ({"answer": ""}) when the model thinks the text doesn't have one
+        self.contexts = LRUCache(max_contexts) # context text -> _Context
+
+        if self.stride >= self.max_length:
+            raise ValueError(f"stride ({self.stride}) has to be smaller than max_length ({self.max_length})")
+
+        # NOTE: where the special tokens go around a (question, context) pair differs between models ([CLS] q [SEP] c [SEP] for bert, <s> q </s></s> c </s> for roberta). Tokenizing one tiny pair shows the layout, so windows can be put together from ids without tokenizing again
+        probe = tokenizer("question", "context")
+        sequence_ids = probe.sequence_ids()
+        types = probe.get("token_type_ids") or [0] * len(sequence_ids)
+        question = [position for position, sequence in enumerate(sequence_ids) if sequence == 0]
+        context = [position for position, sequence in enumerate(sequence_ids) if sequence == 1]
+        self._layout = {
+            "prefix": (probe["input_ids"][:question[0]], types[:question[0]]),
+            "middle": (probe["input_ids"][question[-1] + 1:context[0]], types[question[-1] + 1:context[0]]),
+            "suffix": (probe["input_ids"][context[-1] + 1:], types[context[-1] + 1:]),
+        }
+        self._types = (types[question[0]], types[context[0]])
+        self._uses_types = "token_type_ids" in tokenizer.model_input_names
+
+    def context(self, text: str) -> _Context:
+        context = self.contexts.get(text)
+        if context is None:
+            context = _Context(self.tokenizer, text)
+            self.contexts.put(text, context)
+        return context
+
+    # the windows for one question: (input ids, token type ids, position of the first context token, first context token covered)
+    def _windows(self, question: list, context: _Context) -> list:
+        prefix, middle, suffix = self._layout["prefix"], self._layout["middle"], self._layout["suffix"]
+        size = self.max_length - len(prefix[0]) - len(question) - len(middle[0]) - len(suffix[0]) # context tokens per window
+        if size <= self.stride:
+            raise ValueError(f"The question is too long to leave room for the context with max_length={self.max_length} and stride={self.stride}")
+
+        question_type, context_type = self._types
+        offset = len(prefix[0]) + len(question) + len(middle[0])
+
+        windows = []
+        first = 0
+        while True:
+            part = context.ids[first:first + size]
+            ids = prefix[0] + question + middle[0] + part + suffix[0]
+            types = prefix[1] + [question_type] * len(question) + middle[1] + [context_type] * len(part) + suffix[1]
+            windows.append((ids, types, offset, first))
+
+            if first + size >= len(context.ids):
+                return windows
+            first += size - self.stride
+
+    # the best answer within one window, and the window's "no answer" score
+    def _best(self, ids: list, offset: int, length: int, start: torch.Tensor, end: torch.Tensor) -> tuple:
+        # only context tokens (and [CLS], which models use to say "no answer") can be part of the answer
+        allowed = torch.zeros(len(ids), dtype=torch.bool)
+        allowed[offset:offset + length] = True
+        allowed |= torch.tensor(ids) == self.tokenizer.cls_token_id
+
+        start = start.masked_fill(~allowed, -10000.0).softmax(dim=-1)
+        end = end.masked_fill(~allowed, -10000.0).softmax(dim=-1)
+        null = (start[0] * end[0]).item()
+        start[0] = end[0] = 0.0
+
+        # score of every (start, end) pair, keeping only answers that end after they start and are at most max_answer_length tokens long
+        candidates = torch.outer(start, end).triu().tril(self.max_answer_length - 1)
+        first, last = divmod(candidates.argmax().item(), len(ids))
+        if not (allowed[first] and allowed[last]):
+            return None, null
+        return (first, last, candidates[first, last].item()), null
+
+    # answers for [{"question": ..., "context": ...}, ...], in order. A single dict gives a single answer
+    def __call__(self, questions):
+        single = isinstance(questions, dict)
+        questions = [questions] if single else list(questions)
+        if not questions:
+            return []
+
+        contexts = [self.context(item["context"]) for item in questions]
+        question_ids = self.tokenizer([item["question"] for item in questions], add_special_tokens=False)["input_ids"]
+
+        # every window of every question, then all of them through the model in length buckets
+        windows = [(number, *window) for number, (ids, context) in enumerate(zip(question_ids, contexts)) for window in self._windows(ids, context)]
+        logits = [None] * len(windows)
+        for bucket in buckets([len(window[1]) for window in windows], self.batch_size, self.max_tokens):
+            batch = pad_batch([windows[position][1:3] for position in bucket], self.tokenizer.pad_token_id, self._uses_types)
+            with torch.no_grad():
+                outputs = self.model(**batch)
+            for row, position in enumerate(bucket):
+                length = len(windows[position][1])
+                logits[position] = (outputs.start_logits[row, :length].float(), outputs.end_logits[row, :length].float())
+
+        best = [None] * len(questions) # (score, first, last) in context tokens
+        null = [1000000.0] * len(questions) # lowest "no answer" score over the windows, like the pipeline
+        for (number, ids, _, offset, first_token), (start, end) in zip(windows, logits):
+            length = len(ids) - offset - len(self._layout["suffix"][0]) # context tokens in this window
+            answer, null_score = self._best(ids, offset, length, start, end)
+            null[number] = min(null[number], null_score)
+            if answer is not None and (best[number] is None or answer[2] > best[number][0]):
+                first, last, score = answer
+                best[number] = (score, first - offset + first_token, last - offset + first_token)
+
+        results = []
+        for number, context in enumerate(contexts):
+            answer = {"score": 0.0, "start": 0, "end": 0, "answer": ""}
+            if best[number] is not None:
+                score, first, last = best[number]
+                start, end = context.span(first, last)
+                answer = {"score": score, "start": start, "end": end, "answer": context.text[start:end]}
+            if self.handle_impossible_answer and null[number] > answer["score"]:
+                answer = {"score": null[number], "start": 0, "end": 0, "answer": ""}
+            results.append(answer)
+        return results[0] if single else results
+
+    # a question-answering pipeline (ex. pipeline(model="deepset/roberta-base-squad2")) works too
+    @classmethod
+    def from_pipeline(cls, pipe, **kwargs) -> "QuestionAnswerer":
+        return cls(pipe.model, pipe.tokenizer, **kwargs)
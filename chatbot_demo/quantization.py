@@ -0,0 +1,53 @@
+import os
+
+import torch
+from transformers import AutoConfig, AutoTokenizer, AutoModelForSequenceClassification
+
+from batching import to_predictions
+from fast_start import local_folder
+
+# an int8 version of a sequence classification model for cpu only hosts
+# NOTE: almost all of a transformer's work is matrix multiplications in its linear layers. Dynamic quantization stores those weights as 8 bit integers instead of 32 bit floats (about 4x smaller), and converts each layer's input to int8 on the fly, so the multiplications run with fast integer instructions. Nothing needs retraining or calibration data
+# NOTE: the quantized model is still a normal torch module with the same forward(), so it drops in anywhere the fp32 one is used (predict below, BatchingClassifier, CachedClassifier, classify_bucketed)
+# NOTE: int8 weights are a little less precise, so a few borderline predictions can flip. python -m benchmarks.quantization measures how many
+
+# the int8 copy of a model. The fp32 model passed in is left untouched
+def quantize(model):
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8).eval()
+
+def quantized_folder(model_name: str) -> str:
+    return local_folder(model_name) + "--int8"
+
+# quantize a model once and save it (with its config and tokenizer) into the local model cache, so later starts skip the quantization
+def save_quantized(model_name: str, tokenizer=None, model=None) -> str:
+    folder = quantized_folder(model_name)
+    tokenizer = tokenizer or AutoTokenizer.from_pretrained(model_name)
+    model = model or AutoModelForSequenceClassification.from_pretrained(model_name)
+
+    os.makedirs(folder, exist_ok=True)
+    tokenizer.save_pretrained(folder)
+    model.config.save_pretrained(folder)
+    torch.save(quantize(model).state_dict(), os.path.join(folder, "int8.pt"))
+    return folder
+
+# (tokenizer, model) ready for predict(). quantized=True loads the int8 copy from the local cache, quantizing and saving it the first time
+def load_model(model_name: str, quantized: bool = False):
+    if not quantized:
+        return AutoTokenizer.from_pretrained(model_name), AutoModelForSequenceClassification.from_pretrained(model_name).eval()
+
+    folder = quantized_folder(model_name)
+    if not os.path.isfile(os.path.join(folder, "int8.pt")):
+        # NOTE: the fp32 weights are only read here, the first time, and only once
+        save_quantized(model_name, AutoTokenizer.from_pretrained(model_name), AutoModelForSequenceClassification.from_pretrained(model_name))
+
+    # NOTE: a quantized state dict only loads into a model that has the same quantized layers, so the model is built from its config (no weights are read), quantized, and then filled in
+    model = quantize(AutoModelForSequenceClassification.from_config(AutoConfig.from_pretrained(folder)))
+    # NOTE: the packed int8 weights aren't plain tensors, so weights_only loading can't read them. Only load files this cache wrote itself
+    model.load_state_dict(torch.load(os.path.join(folder, "int8.pt"), weights_only=False))
+    return AutoTokenizer.from_pretrained(folder), model.eval()
+
+# {"label": ..., "score": ...} for every text, the same for the fp32 and the int8 model
+def predict(model, tokenizer, texts: list, max_length: int = 512) -> list:
+    batch = tokenizer(texts, padding=True, truncation=True, max_length=max_length, return_tensors="pt")
+    with torch.no_grad():
+        return to_predictions(model, model(**batch).logits)
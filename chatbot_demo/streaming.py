@@ -0,0 +1,125 @@
+import asyncio
+import threading
+import time
+
+from transformers import StoppingCriteria, StoppingCriteriaList, TextIteratorStreamer
+
+# text generation that hands over each piece of text as soon as it's decoded, instead of waiting for the whole answer
+# NOTE: generate() produces one token at a time anyway, so a 50 token answer that takes 3 seconds in total can show its first words after a few hundred milliseconds. That time to first token is what users actually feel
+# NOTE: generation runs on a background thread and pushes decoded text into a queue (TextIteratorStreamer), and iterating over the stream reads from that queue
+#
+# used from a flask route, the client sees the text as it's written, and closing the page stops the generation:
+#     return Response(stream_with_context(TokenStream(model, tokenizer, prompt)), mimetype="text/plain")
+# or from a socket.io handler:
+#     for piece in TokenStream(model, tokenizer, prompt):
+#         emit("bot_token", piece)
+
+
+# stops generate() once the event is set
+class _Cancelled(StoppingCriteria):
+    def __init__(self, event: threading.Event):
+        self.event = event
+
+    def __call__(self, input_ids, scores, **kwargs) -> bool:
+        return self.event.is_set()
+
+
+class TokenStream:
+    # max_time is the budget in seconds for the whole answer (generation simply ends once it runs out). Other keyword arguments go to model.generate (ex. do_sample=True, temperature=0.8)
+    # NOTE: this streams a single answer. For several different answers to the same prompt (num_return_sequences), make one stream per answer
+    def __init__(self, model, tokenizer, prompt: str, max_new_tokens: int = 50, max_time: float = None, **generate_kwargs):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.prompt = prompt
+        self.max_new_tokens = max_new_tokens
+        self.max_time = max_time
+        self.generate_kwargs = generate_kwargs
+
+        self.time_to_first_token = None # seconds from starting until the first piece of text was ready
+        self.elapsed = None # seconds until the answer was complete (or cancelled)
+        self.pieces = 0
+
+        self._cancelled = threading.Event()
+        self._started = False
+        self._error = None
+
+    # a text-generation pipeline (ex. pipeline("text-generation", model="distilgpt2")) works too
+    @classmethod
+    def from_pipeline(cls, pipe, prompt: str, **kwargs) -> "TokenStream":
+        return cls(pipe.model, pipe.tokenizer, prompt, **kwargs)
+
+    # stop generating. Safe to call from any thread (ex. a disconnect handler)
+    def cancel(self) -> None:
+        self._cancelled.set()
+
+    def __iter__(self):
+        if self._started:
+            raise RuntimeError("A TokenStream can only be read once")
+        self._started = True
+
+        start = time.perf_counter()
+        streamer = TextIteratorStreamer(self.tokenizer, skip_prompt=True, skip_special_tokens=True)
+        inputs = self.tokenizer(self.prompt, return_tensors="pt")
+
+        kwargs = {
+            **inputs,
+            "streamer": streamer,
+            "max_new_tokens": self.max_new_tokens,
+            "stopping_criteria": StoppingCriteriaList([_Cancelled(self._cancelled)]),
+            # NOTE: models like gpt2 have no padding token, and generate() warns on every call unless one is given
+            "pad_token_id": self.tokenizer.pad_token_id if self.tokenizer.pad_token_id is not None else self.tokenizer.eos_token_id,
+            **self.generate_kwargs,
+        }
+        if self.max_time is not None:
+            kwargs["max_time"] = self.max_time
+
+        thread = threading.Thread(target=self._generate, args=(streamer, kwargs), daemon=True)
+        thread.start()
+
+        try:
+            for piece in streamer:
+                if not piece:
+                    continue
+                if self.time_to_first_token is None:
+                    self.time_to_first_token = time.perf_counter() - start
+                self.pieces += 1
+                yield piece
+        finally:
+            # NOTE: also runs when the reader stops early (ex. flask closes the generator because the client went away), so the model never keeps generating for nobody
+            self.cancel()
+            thread.join()
+            self.elapsed = time.perf_counter() - start
+
+        if self._error is not None:
+            raise self._error
+
+    def _generate(self, streamer, kwargs):
+        try:
+            self.model.generate(**kwargs)
+        except Exception as error:
+            # NOTE: without this the reader would wait forever for text that is never coming
+            self._error = error
+            streamer.end()
+
+    # the same pieces for asyncio code: async for piece in stream
+    # NOTE: waiting for the next piece happens in a thread, so the event loop keeps serving other clients in the meantime
+    async def __aiter__(self):
+        loop = asyncio.get_running_loop()
+        pieces = iter(self)
+        done = object()
+        try:
+            while True:
+                piece = await loop.run_in_executor(None, next, pieces, done)
+                if piece is done:
+                    return
+                yield piece
+        finally:
+            self.cancel()
+            try:
+                await loop.run_in_executor(None, pieces.close)
+            except ValueError:
+                pass # the task was cancelled while a thread was still waiting on next(). That thread finishes by itself now that generation is cancelled
+
+    # the whole answer as one string (what the pipeline would return)
+    def text(self) -> str:
+        return "".join(self)
@@ -0,0 +1,69 @@
+import torch
+
+from batching import buckets, pad_batch
+
+# zero-shot classification of many texts against one fixed set of labels (ex. tagging thousands of chat messages with the same 20 topics)
+# NOTE: zero-shot models are NLI models: they read a (premise, hypothesis) pair and say whether the premise entails the hypothesis. The pipeline turns every label into a hypothesis ("This example is hockey.") and runs one pair per label, so tagging a text with 20 labels is 20 pairs, and the hypotheses are tokenized again for every label of every call
+# here:
+#   the hypotheses are tokenized once, when the classifier is made
+#   each text is tokenized once (not once per label), and its ids are combined with every cached hypothesis
+#   the pairs of all the texts are run together, in batches of similar length (see batching.buckets), instead of one call per text
+# results are the same as the pipeline's: {"sequence": ..., "labels": [...], "scores": [...]}, best label first
+
+
+class ZeroShotClassifier:
+    def __init__(self, model, tokenizer, candidate_labels: list, hypothesis_template: str = "This example is {}.", multi_label: bool = False, batch_size: int = 64, max_tokens: int = None, max_length: int = 512):
+        self.model = model.eval()
+        self.tokenizer = tokenizer
+        self.candidate_labels = list(candidate_labels)
+        self.multi_label = multi_label # score every label on its own, instead of the labels competing for one answer
+        self.batch_size = batch_size # pairs per forward pass
+        self.max_tokens = max_tokens # padded tokens per forward pass (see batching.buckets)
+        self.max_length = max_length
+
+        # the same label names the pipeline looks for (ex. "ENTAILMENT" or "entailment")
+        self.entailment_id = next((label_id for label, label_id in model.config.label2id.items() if label.lower().startswith("entail")), -1)
+        self.contradiction_id = -1 if self.entailment_id == 0 else 0
+
+        self.hypotheses = [tokenizer.encode(hypothesis_template.format(label), add_special_tokens=False) for label in self.candidate_labels]
+
+        # NOTE: bert style models also need to be told which tokens belong to the premise and which to the hypothesis (token_type_ids), otherwise their predictions change
+        self._uses_types = "token_type_ids" in tokenizer.model_input_names
+
+    # (input ids, token type ids) of a premise and hypothesis pair
+    def _pair(self, premise: list, hypothesis: list) -> tuple:
+        # NOTE: only the premise is ever cut short, so a long text never loses its label
+        encoded = self.tokenizer.prepare_for_model(premise, hypothesis, truncation="only_first", max_length=self.max_length, return_attention_mask=False, return_token_type_ids=True)
+        return encoded["input_ids"], encoded["token_type_ids"]
+
+    # one result per text, or a single result for a single string
+    def __call__(self, texts):
+        single = isinstance(texts, str)
+        texts = [texts] if single else list(texts)
+        if not texts:
+            return []
+
+        premises = self.tokenizer(texts, add_special_tokens=False)["input_ids"]
+        pairs = [self._pair(premise, hypothesis) for premise in premises for hypothesis in self.hypotheses]
+
+        logits = torch.empty((len(pairs), self.model.config.num_labels))
+        for bucket in buckets([len(ids) for ids, _ in pairs], self.batch_size, self.max_tokens):
+            with torch.no_grad():
+                logits[bucket] = self.model(**pad_batch([pairs[position] for position in bucket], self.tokenizer.pad_token_id, self._uses_types)).logits.float()
+
+        logits = logits.view(len(texts), len(self.hypotheses), -1)
+        if self.multi_label or len(self.hypotheses) == 1:
+            scores = logits[..., [self.contradiction_id, self.entailment_id]].softmax(dim=-1)[..., 1]
+        else:
+            scores = logits[..., self.entailment_id].softmax(dim=-1)
+
+        results = []
+        for text, row in zip(texts, scores.tolist()):
+            order = sorted(range(len(row)), key=row.__getitem__, reverse=True)
+            results.append({"sequence": text, "labels": [self.candidate_labels[i] for i in order], "scores": [row[i] for i in order]})
+        return results[0] if single else results
+
+    # a zero-shot pipeline (ex. pipeline("zero-shot-classification")) works too
+    @classmethod
+    def from_pipeline(cls, pipe, candidate_labels: list, **kwargs) -> "ZeroShotClassifier":
+        return cls(pipe.model, pipe.tokenizer, candidate_labels, **kwargs)
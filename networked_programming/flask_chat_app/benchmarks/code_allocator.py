@@ -0,0 +1,60 @@
+# compares the old retry loop for room codes against RoomCodeAllocator at different levels of code space occupancy
+# run from the flask_chat_app folder: python -m benchmarks.code_allocator
+import argparse
+import random
+import time
+from string import ascii_uppercase
+
+from static.utils import RoomCodeAllocator
+
+# the original generate_unique_code, kept here as the baseline
+def generate_unique_code(length: int, rooms_dict: dict) -> str:
+    while True:
+        code = ""
+        for _ in range(length):
+            code += random.choice(ascii_uppercase)
+
+        if code not in rooms_dict:
+            break
+
+    return code
+
+def bench_retry_loop(occupancy: float, calls: int, length: int) -> float:
+    space = len(ascii_uppercase) ** length
+    allocator = RoomCodeAllocator(length, max_load=1.0)
+    rooms = {allocator.allocate(): None for _ in range(int(space * occupancy))}
+
+    start = time.perf_counter()
+    for _ in range(calls):
+        # the code is not kept, so the occupancy stays the same for every call
+        generate_unique_code(length, rooms)
+    return (time.perf_counter() - start) / calls
+
+def bench_allocator(occupancy: float, calls: int, length: int) -> float:
+    space = len(ascii_uppercase) ** length
+    # max_load=1.0 so the allocator stays on this code length (it would normally grow at 90%)
+    allocator = RoomCodeAllocator(length, max_load=1.0)
+    for _ in range(int(space * occupancy)):
+        allocator.allocate()
+
+    start = time.perf_counter()
+    for _ in range(calls):
+        # allocate and release again, so the occupancy stays the same for every call
+        allocator.release(allocator.allocate())
+    return (time.perf_counter() - start) / calls
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--length", type=int, default=4)
+    parser.add_argument("--calls", type=int, default=20000)
+    parser.add_argument("--occupancy", type=float, nargs="+", default=[0.10, 0.90, 0.99])
+    args = parser.parse_args()
+
+    print(f"{'occupancy':>10} {'retry loop':>14} {'allocator':>14}")
+    for occupancy in args.occupancy:
+        retry = bench_retry_loop(occupancy, args.calls, args.length)
+        allocator = bench_allocator(occupancy, args.calls, args.length)
+        print(f"{occupancy:>10.0%} {retry * 1e6:>11.2f} us {allocator * 1e6:>11.2f} us")
+
+if __name__ == "__main__":
+    main()
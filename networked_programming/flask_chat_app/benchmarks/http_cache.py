@@ -0,0 +1,73 @@
+# requests/s of the home page and a static file with the http caching (CHAT_HTTP_CACHE) off and on
+# requests are prebuilt WSGI environs handed straight to the app, so this measures the server's own work per request (no network, no client)
+# req/s is per second of cpu time, ie. what one fully busy worker process could serve
+# run from the flask_chat_app folder: python -m benchmarks.http_cache --seconds 3
+import argparse
+import os
+import time
+
+os.environ["CHAT_MESSAGE_DB"] = "" # nothing here sends messages, so don't create chat.db
+
+from werkzeug.test import EnvironBuilder
+
+import main
+
+def request(environ: dict) -> tuple:
+    status = []
+    body = b"".join(main.app(dict(environ), lambda code, headers, exc_info=None: status.append((code, headers))))
+    return int(status[0][0].split()[0]), dict(status[0][1]), body
+
+def measure(url: str, seconds: float, headers: dict = None) -> tuple:
+    environ = EnvironBuilder(path=url.split("?")[0], query_string=url.partition("?")[2], headers=headers).get_environ()
+    status, _, body = request(environ)
+
+    # NOTE: cpu time of this process rather than wall time, and the best of several short rounds, so other work on the machine skews the numbers as little as possible
+    best = 0
+    for _ in range(5):
+        requests = 0
+        start = time.process_time()
+        while time.process_time() - start < seconds / 5:
+            request(environ)
+            requests += 1
+        best = max(best, requests / (time.process_time() - start))
+    return best, status, len(body)
+
+def header(url: str, name: str, headers: dict = None) -> str:
+    return request(EnvironBuilder(path=url, headers=headers).get_environ())[1][name]
+
+def set_caching(enabled: bool):
+    main.app.config["HTTP_CACHE"] = enabled
+    main.fragments.enabled = enabled
+    main.fragments.clear()
+    main.app.view_functions["static"] = main.static_file if enabled else main.app.send_static_file
+
+def main_():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=float, default=3)
+    args = parser.parse_args()
+
+    gzip = {"Accept-Encoding": "gzip, deflate, br"}
+    css = "/static/css/style.css"
+
+    print(f"{'request':42} {'req/s':>9} {'status':>7} {'bytes':>7}")
+    set_caching(False)
+    results = [
+        ("GET / (no caching)", measure("/", args.seconds)),
+        (f"GET {css} (no caching)", measure(css, args.seconds, gzip)),
+    ]
+
+    set_caching(True)
+    etag = header("/", "ETag")
+    asset = header(css, "ETag", gzip)
+    results += [
+        ("GET / (cached fragments)", measure("/", args.seconds)),
+        ("GET / (If-None-Match, 304)", measure("/", args.seconds, {"If-None-Match": etag})),
+        (f"GET {css} (precompressed)", measure(css, args.seconds, gzip)),
+        (f"GET {css} (If-None-Match, 304)", measure(css, args.seconds, {**gzip, "If-None-Match": asset})),
+    ]
+
+    for name, (rate, status, size) in results:
+        print(f"{name:42} {rate:9.0f} {status:7} {size:7}")
+
+if __name__ == "__main__":
+    main_()
@@ -0,0 +1,250 @@
+# load generator and latency benchmark for the chat server
+# it starts the app on a local port, then drives simulated users through the real flow: POST "/" (create or join a room) -> GET "/room" -> socket connect -> socket messages
+# every message carries its send time, so the harness can tell how long it took until *every* member of the room had received it (the fan-out latency)
+# needs the async socket.io client: pip install "python-socketio[asyncio_client]"
+# run from the flask_chat_app folder, ex:
+#   python -m benchmarks.load_test --clients 100 --rooms 10 --rate 50
+#   python -m benchmarks.load_test --clients 50 200 500 --rooms 10 --rate 20 100 --csv results.csv (runs every combination)
+import argparse
+import asyncio
+import csv
+import itertools
+import os
+import re
+import socket
+import subprocess
+import sys
+import time
+
+import aiohttp
+import socketio
+
+APP_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# the dev server can't be started through serve.py, so it gets a small inline launcher instead
+THREADING_LAUNCHER = "import os; from main import app, socketio; socketio.run(app, port=int(os.environ['CHAT_PORT']), allow_unsafe_werkzeug=True)"
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def start_server(mode: str, port: int, extra_env: dict) -> subprocess.Popen:
+    env = {**os.environ, "CHAT_ASYNC_MODE": mode, "CHAT_PORT": str(port), "CHAT_MESSAGE_DB": "", **extra_env}
+    command = [sys.executable, "-c", THREADING_LAUNCHER] if mode == "threading" else [sys.executable, "serve.py"]
+    server = subprocess.Popen(command, cwd=APP_FOLDER, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    # wait until the port accepts connections
+    deadline = time.monotonic() + 15
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return server
+        except OSError:
+            time.sleep(0.05)
+
+    server.kill()
+    raise RuntimeError(f"server ({mode}) did not start on port {port}")
+
+# resident memory of the server process in MB: (current, peak). Only available on linux
+def server_rss(pid: int):
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            fields = dict(line.split(":", 1) for line in status)
+    except OSError:
+        return None, None
+    return int(fields["VmRSS"].split()[0]) / 1024, int(fields["VmHWM"].split()[0]) / 1024
+
+def percentile(values: list, fraction: float):
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+# one simulated user: an http session (for the flask session cookie) plus a socket.io connection
+class SimulatedUser:
+    def __init__(self, base_url: str, name: str, results: "Results"):
+        self.base_url = base_url
+        self.name = name
+        self.results = results
+        self.http = aiohttp.ClientSession(cookie_jar=aiohttp.CookieJar(unsafe=True))
+        self.sio = socketio.AsyncClient(reconnection=False)
+        self.sio.on("message", self._on_message)
+        self.sio.on("message_batch", self._on_batch)
+        self.code = None
+
+    # home -> room, exactly like the html form does. Returns the room code
+    async def enter(self, code=None) -> str:
+        form = {"name": self.name, "code": code or ""}
+        form["join" if code else "create"] = "1"
+
+        async with self.http.post(f"{self.base_url}/", data=form) as response:
+            # aiohttp follows the redirect to /room, so the page with the room code comes back
+            page = await response.text()
+
+        match = re.search(r"Chat Room: (\w+)", page)
+        if match is None:
+            raise RuntimeError(f"{self.name} could not enter a room (status {response.status})")
+        self.code = match.group(1)
+        return self.code
+
+    async def connect(self):
+        cookies = "; ".join(f"{cookie.key}={cookie.value}" for cookie in self.http.cookie_jar)
+        # NOTE: a generous wait_timeout, since hundreds of users connecting at once can take the server longer than the 1 second default
+        await self.sio.connect(self.base_url, headers={"Cookie": cookies}, transports=["websocket"], wait_timeout=30)
+
+    async def send(self, text: str):
+        await self.sio.send({"data": text})
+
+    async def close(self):
+        if self.sio.connected:
+            await self.sio.disconnect()
+        await self.http.close()
+
+    def _on_message(self, data):
+        self.results.received(data.get("message", ""))
+
+    def _on_batch(self, batch):
+        for data in batch:
+            self._on_message(data)
+
+
+# keeps track of every benchmark message and when each member received it
+class Results:
+    def __init__(self):
+        self.sent = {} # message id -> (send time, members expected to receive it)
+        self.receipts = {} # message id -> [receive count, time of the last receipt]
+
+    def sending(self, message_id: str, members: int):
+        self.sent[message_id] = (time.perf_counter(), members)
+        self.receipts[message_id] = [0, None]
+
+    def received(self, text: str):
+        if not text.startswith("bench:"):
+            return # join/leave notices
+        receipt = self.receipts.get(text)
+        if receipt is not None:
+            receipt[0] += 1
+            receipt[1] = time.perf_counter()
+
+    # fan-out latency (seconds) of every message that reached all of its room's members
+    def fanout_latencies(self) -> list:
+        latencies = []
+        for message_id, (sent_at, members) in self.sent.items():
+            count, last = self.receipts[message_id]
+            if count >= members:
+                latencies.append(last - sent_at)
+        return latencies
+
+    def deliveries(self) -> int:
+        return sum(count for count, _ in self.receipts.values())
+
+
+async def run_load(base_url: str, clients: int, rooms: int, rate: float, duration: float, concurrency: int) -> dict:
+    results = Results()
+    users = [SimulatedUser(base_url, f"user{i}", results) for i in range(clients)]
+
+    try:
+        return await drive(users, results, rooms, rate, duration, concurrency)
+    finally:
+        await asyncio.gather(*(user.close() for user in users), return_exceptions=True)
+
+async def drive(users: list, results: Results, rooms: int, rate: float, duration: float, concurrency: int) -> dict:
+    # users enter and connect a limited number at a time, like a crowd arriving rather than all in the same millisecond
+    gate = asyncio.Semaphore(concurrency)
+
+    async def gated(call):
+        async with gate:
+            return await call
+
+    # the first user of every room creates it, and the rest join round robin
+    creators, joiners = users[:rooms], users[rooms:]
+    codes = await asyncio.gather(*(gated(user.enter()) for user in creators))
+    await asyncio.gather(*(gated(user.enter(codes[i % rooms])) for i, user in enumerate(joiners)))
+
+    connect_start = time.perf_counter()
+    await asyncio.gather(*(gated(user.connect()) for user in users))
+    connect_time = time.perf_counter() - connect_start
+
+    members = {code: sum(1 for user in users if user.code == code) for code in codes}
+
+    # messages go out at a fixed overall rate, with the users taking turns sending
+    interval = 1 / rate
+    sent = 0
+    start = time.perf_counter()
+    for sender in itertools.cycle(users):
+        now = time.perf_counter()
+        if now - start >= duration:
+            break
+
+        message_id = f"bench:{sent}"
+        results.sending(message_id, members[sender.code])
+        await sender.send(message_id)
+        sent += 1
+
+        await asyncio.sleep(max(0, start + sent * interval - time.perf_counter()))
+    elapsed = time.perf_counter() - start
+
+    # give stragglers a moment to arrive before counting
+    await asyncio.sleep(1)
+    latencies = results.fanout_latencies()
+
+    return {
+        "sent_per_s": sent / elapsed,
+        "delivered_per_s": results.deliveries() / elapsed,
+        "complete": len(latencies) / max(1, sent),
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "connect_s": connect_time,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="load test for the flask chat app")
+    parser.add_argument("--mode", choices=["threading", "gevent", "eventlet"], default="gevent", help="CHAT_ASYNC_MODE of the server")
+    parser.add_argument("--clients", type=int, nargs="+", default=[100], help="simulated users (every value is a separate run)")
+    parser.add_argument("--rooms", type=int, nargs="+", default=[10], help="rooms the users are spread over")
+    parser.add_argument("--rate", type=float, nargs="+", default=[50], help="messages per second sent across all rooms")
+    parser.add_argument("--duration", type=float, default=10, help="seconds to send messages for")
+    parser.add_argument("--concurrency", type=int, default=100, help="max users entering/connecting at the same time")
+    parser.add_argument("--coalesce-ms", type=float, default=0, help="CHAT_COALESCE_MS for the server")
+    parser.add_argument("--url", help="test an already running server instead of starting one (no RSS is reported)")
+    parser.add_argument("--csv", help="also append every result row to this csv file")
+    args = parser.parse_args()
+
+    columns = ["mode", "clients", "rooms", "rate", "sent_per_s", "delivered_per_s", "complete", "p50_ms", "p99_ms", "connect_s", "rss_mb", "peak_rss_mb"]
+    print(" ".join(f"{column:>15}" for column in columns))
+
+    for clients, rooms, rate in itertools.product(args.clients, args.rooms, args.rate):
+        server = None
+        base_url = args.url
+        if base_url is None:
+            port = free_port()
+            server = start_server(args.mode, port, {"CHAT_COALESCE_MS": str(args.coalesce_ms)})
+            base_url = f"http://127.0.0.1:{port}"
+
+        # NOTE: a run the server can't keep up with (refused or timed out connections, ...) is reported and the sweep goes on, so one sweep can find where each mode stops working
+        try:
+            row = asyncio.run(run_load(base_url, clients, min(rooms, clients), rate, args.duration, args.concurrency))
+            rss, peak = server_rss(server.pid) if server else (None, None)
+        except Exception as error:
+            print(f"{args.mode:>15} {clients:>15} {rooms:>15} {rate:>15.2f}  failed: {type(error).__name__}: {error}")
+            continue
+        finally:
+            if server:
+                server.terminate()
+                server.wait()
+
+        row = {"mode": args.mode, "clients": clients, "rooms": rooms, "rate": rate, **row, "rss_mb": rss, "peak_rss_mb": peak}
+        print(" ".join(f"{row[column]:>15.2f}" if isinstance(row[column], float) else f"{str(row[column]):>15}" for column in columns))
+
+        if args.csv:
+            new_file = not os.path.exists(args.csv)
+            with open(args.csv, "a", newline="") as file:
+                writer = csv.DictWriter(file, fieldnames=columns)
+                if new_file:
+                    writer.writeheader()
+                writer.writerow(row)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+# messages/s the moderation stage can screen at different batch sizes, compared to classifying one message at a time inline (what message() would have to do without it)
+# every message goes through the real Moderator: submit() -> collector -> worker process -> result
+# run from the flask_chat_app folder: python -m benchmarks.moderation --batch-sizes 1 8 32 64 (needs: pip install torch transformers)
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from flask import Flask
+from flask_socketio import SocketIO
+
+from static.utils import Moderator, load_pretrained
+from static.utils import moderation
+
+WORDS = "hey sounds good see you at the game tonight lol did you watch the highlights that was awful terrible pass what a goal refs were blind again honestly best period all season".split()
+
+def make_messages(count: int) -> list:
+    rng = random.Random(0)
+    return [" ".join(rng.choices(WORDS, k=rng.randint(2, 30))) for _ in range(count)]
+
+# the model from the hub, or when the hub can't be reached (ex. no network), a model of the same size with random weights. The predictions are meaningless then, but every forward pass costs exactly the same
+def load_model(model_name: str):
+    try:
+        return load_pretrained(model_name)
+    except OSError:
+        from transformers import DistilBertConfig, DistilBertForSequenceClassification, DistilBertTokenizerFast
+
+        folder = tempfile.mkdtemp()
+        vocab = os.path.join(folder, "vocab.txt")
+        with open(vocab, "w") as file:
+            file.write("\n".join(["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"] + sorted(set(WORDS))))
+
+        config = DistilBertConfig(id2label={0: "NEGATIVE", 1: "POSITIVE"}, label2id={"NEGATIVE": 0, "POSITIVE": 1})
+        return DistilBertTokenizerFast(vocab_file=vocab), DistilBertForSequenceClassification(config)
+
+def through_moderator(socketio, args, messages: list, batch_size: int) -> tuple:
+    moderator = Moderator(socketio, args.model, batch_size=batch_size, workers=args.workers, timeout=600, max_pending=len(messages), loader=load_model, on_flagged=lambda *flagged: None)
+
+    # wait for the workers to load the model, so that isn't part of the time
+    moderator._executor.submit(moderation._classify, ["warm up"], moderator.max_length).result()
+
+    start = time.perf_counter()
+    for text in messages:
+        moderator.submit("ROOM", {"name": "user", "message": text})
+
+    while True:
+        stats = moderator.stats()
+        if stats["checked"] + stats["failed"] + stats["timed_out"] >= len(messages):
+            break
+        time.sleep(0.005)
+    elapsed = time.perf_counter() - start
+
+    moderator.close()
+    return len(messages) / elapsed, stats["checked"] / max(1, stats["batches"]), stats["failed"]
+
+def inline(args, messages: list) -> float:
+    moderation._start_worker(load_model, args.model, os.cpu_count() or 1)
+
+    start = time.perf_counter()
+    for text in messages:
+        moderation._classify([text], 128)
+    return len(messages) / (time.perf_counter() - start)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", default="distilbert-base-uncased-finetuned-sst-2-english")
+    parser.add_argument("--messages", type=int, default=512)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 4, 8, 16, 32, 64])
+    parser.add_argument("--workers", type=int, default=1)
+    args = parser.parse_args()
+
+    # the moderator only needs socketio for its background task
+    socketio = SocketIO(Flask(__name__), async_mode="threading")
+    messages = make_messages(args.messages)
+
+    print(f"{args.messages} messages, {args.workers} worker(s), {os.cpu_count()} cpu(s)")
+    print(f"{'batch size':>10} {'msgs/s':>9} {'avg batch':>10} {'failed':>7}")
+    for batch_size in args.batch_sizes:
+        rate, fill, failed = through_moderator(socketio, args, messages, batch_size)
+        print(f"{batch_size:10} {rate:9.1f} {fill:10.1f} {failed:7}")
+
+    # NOTE: last, since it loads torch into this process (the workers above are forked from it)
+    print(f"{'inline':>10} {inline(args, messages):9.1f} {1:10.1f}")
+
+if __name__ == "__main__":
+    main()
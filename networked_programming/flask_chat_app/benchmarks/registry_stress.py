@@ -0,0 +1,81 @@
+# hammers a room registry with joins, leaves and messages from many threads, then checks that no member count drifted
+# run from the flask_chat_app folder: python -m benchmarks.registry_stress (add --sqlite rooms.db to check the sqlite registry)
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from threading import Thread, Barrier
+
+from static.utils import InProcessRoomRegistry, SQLiteRoomRegistry
+
+def worker(registry, codes, operations, barrier, counts, index):
+    rng = random.Random(index)
+    joined = []
+
+    # every thread starts at once, to get as much overlap as possible
+    barrier.wait()
+    for _ in range(operations):
+        action = rng.random()
+        if action < 0.45:
+            code = rng.choice(codes)
+            if registry.join(code):
+                joined.append(code)
+        elif action < 0.9 and joined:
+            # only leave rooms this thread actually joined, just like disconnect() does
+            registry.leave(joined.pop(rng.randrange(len(joined))))
+        else:
+            registry.add_message(rng.choice(codes), {"name": f"t{index}", "message": "hi"})
+
+    counts[index] = joined
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--rooms", type=int, default=8)
+    parser.add_argument("--operations", type=int, default=20000)
+    parser.add_argument("--sqlite", help="sqlite file to test SQLiteRoomRegistry with (default is the in-process registry)")
+    args = parser.parse_args()
+
+    # NOTE: switching threads much more often than normal makes races far more likely to show up
+    sys.setswitchinterval(1e-6)
+
+    folder = tempfile.TemporaryDirectory()
+    if args.sqlite:
+        registry = SQLiteRoomRegistry(os.path.join(folder.name, args.sqlite), history_limit=100)
+    else:
+        registry = InProcessRoomRegistry(history_limit=100)
+
+    # every room gets one member that never leaves, so rooms stay alive and the final counts can be checked
+    codes = [f"R{i:03}" for i in range(args.rooms)]
+    for code in codes:
+        registry.create(code)
+        registry.join(code)
+
+    counts = [None] * args.threads
+    barrier = Barrier(args.threads)
+    threads = [Thread(target=worker, args=(registry, codes, args.operations, barrier, counts, i)) for i in range(args.threads)]
+
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    failures = 0
+    for code in codes:
+        expected = 1 + sum(joined.count(code) for joined in counts)
+        actual = registry.members(code)
+        if actual != expected:
+            failures += 1
+            print(f"room {code}: expected {expected} members, found {actual}")
+
+    total = args.threads * args.operations
+    print(f"{type(registry).__name__}: {total} operations in {elapsed:.2f}s ({total / elapsed:.0f} ops/s), {failures} rooms with drifted counts")
+    folder.cleanup()
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+# how long snapshots of many rooms take to write and to restore
+# run from the flask_chat_app folder: python -m benchmarks.snapshot_restore --rooms 5000 --messages 200
+import argparse
+import os
+import tempfile
+import time
+
+from static.utils import InProcessRoomRegistry, read_snapshot, write_snapshot
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rooms", type=int, default=5000)
+    parser.add_argument("--messages", type=int, default=200, help="messages per room")
+    args = parser.parse_args()
+
+    registry = InProcessRoomRegistry(history_limit=500)
+    for i in range(args.rooms):
+        code = f"R{i:05}"
+        registry.create(code)
+        for j in range(args.messages):
+            registry.add_message(code, {"name": f"user{j % 7}", "message": f"message number {j} in room {code}"})
+
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "rooms.snapshot")
+
+        start = time.perf_counter()
+        write_snapshot(path, registry)
+        write_time = time.perf_counter() - start
+
+        restored = InProcessRoomRegistry(history_limit=500)
+        start = time.perf_counter()
+        codes = read_snapshot(path, restored)
+        restore_time = time.perf_counter() - start
+
+        # the first look at a room is what pays for decompressing it
+        start = time.perf_counter()
+        messages, _ = restored.history(codes[-1], None, 50)
+        first_open = time.perf_counter() - start
+
+        print(f"{args.rooms} rooms x {args.messages} messages, snapshot is {os.path.getsize(path) / 1e6:.1f} MB")
+        print(f"write:            {write_time * 1000:8.1f} ms")
+        print(f"restore (lazy):   {restore_time * 1000:8.1f} ms")
+        print(f"first room open:  {first_open * 1000:8.3f} ms ({len(messages)} messages)")
+
+if __name__ == "__main__":
+    main()
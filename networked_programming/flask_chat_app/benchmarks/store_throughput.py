@@ -0,0 +1,39 @@
+# compares committing every chat message on its own against the batched (group commit) write-behind store
+# run from the flask_chat_app folder: python -m benchmarks.store_throughput --messages 20000
+import argparse
+import os
+import tempfile
+import time
+
+from static.utils import SQLiteMessageStore
+
+def run(messages: int, batch_size: int) -> float:
+    with tempfile.TemporaryDirectory() as folder:
+        store = SQLiteMessageStore(os.path.join(folder, "bench.db"), batch_size=batch_size)
+        content = {"name": "bench", "message": "x" * 64}
+
+        start = time.perf_counter()
+        for i in range(messages):
+            store.save(f"ROOM{i % 50}", content)
+        # the time only counts once everything is actually on disk
+        store.flush()
+        elapsed = time.perf_counter() - start
+
+        store.close()
+    return messages / elapsed
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 16, 64, 256, 1024])
+    args = parser.parse_args()
+
+    # batch size 1 is a commit per message, which is what writing straight from the socket handler would cost
+    baseline = None
+    for batch_size in args.batch_sizes:
+        rate = run(args.messages, batch_size)
+        baseline = baseline or rate
+        print(f"batch_size={batch_size:<5} {rate:>10.0f} msgs/s  ({rate / baseline:.1f}x)")
+
+if __name__ == "__main__":
+    main()
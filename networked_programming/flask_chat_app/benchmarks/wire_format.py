@@ -0,0 +1,61 @@
+# compares the size and encode/decode cost of chat frames in the current JSON format against msgpack, with and without numbered (interned) senders
+# frames are built with python-socketio's own packet classes, so the sizes are what actually goes over the wire
+# run from the flask_chat_app folder: python -m benchmarks.wire_format (needs: pip install msgpack)
+import argparse
+import random
+import time
+
+from socketio import packet, msgpack_packet
+
+from static.utils import SenderInterner
+
+def make_messages(count: int, senders: int) -> list:
+    rng = random.Random(0)
+    names = [f"{rng.choice(['alex', 'sam', 'jordan', 'taylor', 'morgan'])}_{i}" for i in range(senders)]
+    words = "hey sounds good see you at the game tonight lol did you watch the highlights".split()
+    # ids like the room history hands out, since broadcast messages carry the id they were stored under
+    return [{"id": i, "name": rng.choice(names), "message": " ".join(rng.choices(words, k=rng.randint(2, 12)))} for i in range(count)]
+
+def frames(messages: list, interned: bool) -> list:
+    if not interned:
+        return messages
+
+    senders = SenderInterner()
+    return [[senders.intern("ROOM", content["name"])[0], content["message"], content["id"]] for content in messages]
+
+def measure(packet_class, payloads: list):
+    start = time.perf_counter()
+    encoded = [packet_class(packet.EVENT, data=["message", payload]).encode() for payload in payloads]
+    encode_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for data in encoded:
+        packet_class(encoded_packet=data)
+    decode_time = time.perf_counter() - start
+
+    size = sum(len(data) for data in encoded)
+    return size / len(payloads), encode_time / len(payloads), decode_time / len(payloads)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=50000)
+    parser.add_argument("--senders", type=int, default=20)
+    args = parser.parse_args()
+
+    messages = make_messages(args.messages, args.senders)
+    formats = [
+        ("json (current)", packet.Packet, False),
+        ("json + interned", packet.Packet, True),
+        ("msgpack", msgpack_packet.MsgPackPacket, False),
+        ("msgpack + interned", msgpack_packet.MsgPackPacket, True),
+    ]
+
+    print(f"{'format':<20} {'bytes/frame':>12} {'vs json':>8} {'encode us':>10} {'decode us':>10}")
+    baseline = None
+    for name, packet_class, interned in formats:
+        size, encode, decode = measure(packet_class, frames(messages, interned))
+        baseline = baseline or size
+        print(f"{name:<20} {size:>12.1f} {size / baseline:>7.0%} {encode * 1e6:>10.2f} {decode * 1e6:>10.2f}")
+
+if __name__ == "__main__":
+    main()
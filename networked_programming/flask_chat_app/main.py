@@ -1,6 +1,8 @@
-from flask import Flask, render_template, request, session, redirect, url_for
-from flask_socketio import join_room, leave_room, send, SocketIO
-from static.utils import generate_unique_code as gen_room
+import atexit
+import os
+from flask import Flask, Response, render_template, request, session, redirect, url_for, jsonify, abort
+from flask_socketio import join_room, leave_room, send, emit, SocketIO
+from static.utils import RoomCodeAllocator, SQLiteMessageStore, NullMessageStore, InProcessRoomRegistry, SQLiteRoomRegistry, BroadcastCoalescer, OutboundLimiter, RateLimiter, RoomReaper, Metrics, SenderInterner, SearchIndex, read_snapshot, write_snapshot, StaticAssets, FragmentCache, Moderator
 
 # NOTE: understand the main process to sockets: initialize sockets, then you can send connection events after establishing this connection
 
@@ -9,18 +11,234 @@ app = Flask(__name__)
 
 # configure Flask application
 app.config["SECRET_KEY"] = "djkshf7e3whf" # NOTE: in production environment, this would be encrypted and securely retrieved
+app.config["HISTORY_LIMIT"] = 500 # max number of messages each room keeps (older ones are dropped)
+app.config["HISTORY_PAGE_SIZE"] = 50 # how many messages are sent on page load and per history request
+app.config["MESSAGE_DB"] = os.environ.get("CHAT_MESSAGE_DB", "chat.db") # sqlite file messages are permanently written to (empty string turns persistence off)
+app.config["ROOM_REGISTRY"] = os.environ.get("CHAT_ROOM_REGISTRY", "") # sqlite file shared by all worker processes (empty string keeps rooms in this process only)
+app.config["MESSAGE_QUEUE"] = os.environ.get("CHAT_MESSAGE_QUEUE") # ex. "redis://localhost:6379/0", required when running more than one worker process
+app.config["ASYNC_MODE"] = os.environ.get("CHAT_ASYNC_MODE", "threading") # "threading" (dev server), "gevent" or "eventlet" (see serve.py)
+app.config["COALESCE_WINDOW"] = float(os.environ.get("CHAT_COALESCE_MS", "0")) / 1000 # seconds to buffer room broadcasts for (ex. 0.02), 0 sends every message right away
+app.config["OUTBOX_LIMIT"] = int(os.environ.get("CHAT_OUTBOX_LIMIT", "0")) # max messages buffered for a slow client (0 turns per-client backpressure off)
+app.config["OUTBOX_POLICY"] = os.environ.get("CHAT_OUTBOX_POLICY", "collapse") # what to do when a slow client's outbox is full: "drop_oldest", "collapse" or "disconnect"
+app.config["MESSAGE_RATE"] = float(os.environ.get("CHAT_MESSAGE_RATE", "0")) # messages per second a single client may send (0 is unlimited)
+app.config["MESSAGE_BURST"] = float(os.environ.get("CHAT_MESSAGE_BURST", "10")) # how many messages a client may send in a quick burst before the rate applies
+app.config["EMPTY_ROOM_TTL"] = float(os.environ.get("CHAT_EMPTY_ROOM_TTL", "300")) # seconds a room nobody has joined is kept around
+app.config["ROOM_MAX_IDLE"] = float(os.environ.get("CHAT_ROOM_MAX_IDLE", "86400")) # seconds an empty room can go without any activity before it's deleted (rooms with members are never expired)
+app.config["SNAPSHOT_PATH"] = os.environ.get("CHAT_SNAPSHOT_PATH", "") # file rooms are saved to and restored from across restarts (empty string turns snapshots off)
+app.config["SNAPSHOT_INTERVAL"] = float(os.environ.get("CHAT_SNAPSHOT_INTERVAL", "60")) # seconds between snapshots (one is always taken on shutdown too)
+app.config["HTTP_CACHE"] = os.environ.get("CHAT_HTTP_CACHE", "1") == "1" # precompressed static files, cached page fragments and 304 responses (0 turns them all off)
+app.config["MODERATION_MODEL"] = os.environ.get("CHAT_MODERATION_MODEL", "") # text classification model messages are screened with (ex. distilbert-base-uncased-finetuned-sst-2-english or JungleLee/bert-toxic-comment-classification, needs: pip install torch transformers). Empty string turns moderation off
+app.config["MODERATION_LABELS"] = tuple(os.environ.get("CHAT_MODERATION_LABELS", "NEGATIVE,toxic").split(",")) # model labels that get a message flagged
+app.config["MODERATION_THRESHOLD"] = float(os.environ.get("CHAT_MODERATION_THRESHOLD", "0.9")) # how sure the model has to be before a message is flagged
+app.config["MODERATION_BATCH"] = int(os.environ.get("CHAT_MODERATION_BATCH", "32")) # max messages per model call (see benchmarks/moderation.py)
+app.config["MODERATION_TIMEOUT"] = float(os.environ.get("CHAT_MODERATION_TIMEOUT", "2")) # seconds before a batch is given up on (its messages just stay unflagged)
+app.config["MODERATION_WORKERS"] = int(os.environ.get("CHAT_MODERATION_WORKERS", "1")) # model worker processes
+app.config["WIRE_FORMAT"] = os.environ.get("CHAT_WIRE_FORMAT", "json") # "json", "interned" (json frames with numbered senders) or "compact" (msgpack frames with numbered senders, needs: pip install msgpack)
+
+# per-client backpressure (see OutboundLimiter) sends to each member of this process directly, so with a message queue the members connected to other workers would silently miss every message
+if app.config["OUTBOX_LIMIT"] > 0 and app.config["MESSAGE_QUEUE"]:
+    raise SystemExit("CHAT_OUTBOX_LIMIT only works with a single worker process, it can't be combined with CHAT_MESSAGE_QUEUE")
+
+# sender numbers (see SenderInterner) are handed out by each worker on its own, so with a message queue two workers would give different senders the same number, and clients would show messages under the wrong name
+if app.config["WIRE_FORMAT"] in ("interned", "compact") and app.config["MESSAGE_QUEUE"]:
+    raise SystemExit(f"CHAT_WIRE_FORMAT={app.config['WIRE_FORMAT']} only works with a single worker process, it can't be combined with CHAT_MESSAGE_QUEUE")
+
+# lets templates know which wire format the client has to speak
+@app.context_processor
+def inject_wire_format():
+    return {"wire_format": app.config["WIRE_FORMAT"]}
+
+# css/js served from memory, precompressed and with long cache lifetimes, plus the cache for html that is the same for every user
+assets = StaticAssets(app.static_folder) if app.config["HTTP_CACHE"] else None
+fragments = FragmentCache(enabled=app.config["HTTP_CACHE"])
+app.jinja_env.globals["cached"] = fragments
+
+if assets:
+    # NOTE: this replaces the view behind flask's built-in "/static/<filename>" route. Files that aren't css/js still go through flask as before
+    def static_file(filename):
+        return assets.response(filename, request) or app.send_static_file(filename)
+
+    app.view_functions["static"] = static_file
+
+    # url_for("static", filename=...) adds the file's version, so a changed file gets a new url (and browsers never use a stale copy)
+    @app.url_defaults
+    def add_asset_version(endpoint, values):
+        if endpoint == "static" and "v" not in values:
+            version = assets.version(values.get("filename", ""))
+            if version:
+                values["v"] = version
+
+    # NOTE: cached fragments (the page head) have the "?v=" urls of the assets baked in. Before a page is rendered, the assets are checked (one stat per file) and the fragments are thrown away if any file changed, so pages link to the new version straight away
+    @app.before_request
+    def refresh_assets():
+        if request.endpoint != "static" and assets.refresh():
+            fragments.clear()
+
+# an html response that browsers have to check with the server before reusing, which gets an empty 304 back when the page hasn't changed
+# NOTE: pages depend on the session cookie, so they are marked private (shared caches like proxies must not keep them)
+def conditional(html):
+    response = app.make_response(html)
+    if app.config["HTTP_CACHE"]:
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+        response.add_etag()
+        response = response.make_conditional(request)
+    return response
 
 # socketio integration (used later for actual socket connectivity)
-socketio = SocketIO(app)
+# NOTE: with a message queue, a send() from any worker process is delivered to the clients connected to every other worker as well
+# NOTE: async_mode picks how concurrent connections are handled. "threading" uses one OS thread per connection, while "gevent"/"eventlet" run every handler as a cheap green thread on one event loop
+# NOTE: the "compact" wire format swaps socket.io's JSON packets for msgpack, a binary format that is much quicker to encode and decode (see benchmarks/wire_format.py)
+socketio = SocketIO(
+    app,
+    async_mode=app.config["ASYNC_MODE"],
+    message_queue=app.config["MESSAGE_QUEUE"],
+    serializer="msgpack" if app.config["WIRE_FORMAT"] == "compact" else "default",
+)
+
+# screens messages for toxic/negative content in separate worker processes, and tells the room about the ones it flags
+# NOTE: created before anything else starts a thread, since the workers are forked from this process
+moderator = Moderator(
+    socketio,
+    app.config["MODERATION_MODEL"],
+    flagged_labels=app.config["MODERATION_LABELS"],
+    threshold=app.config["MODERATION_THRESHOLD"],
+    batch_size=app.config["MODERATION_BATCH"],
+    timeout=app.config["MODERATION_TIMEOUT"],
+    workers=app.config["MODERATION_WORKERS"],
+) if app.config["MODERATION_MODEL"] else None
+
+if moderator:
+    atexit.register(moderator.close)
+
+# the registry houses the chat rooms for the project (member counts and recent history). With the sqlite registry and a message queue, any number of worker processes behind a load balancer share one consistent set of rooms
+# NOTE: sqlite waits for another worker's write by sleeping in C, which under gevent/eventlet freezes every connection of this worker, so there it only waits a moment (registry writes take well under a millisecond) before the handler fails
+if app.config["ROOM_REGISTRY"]:
+    rooms = SQLiteRoomRegistry(app.config["ROOM_REGISTRY"], app.config["HISTORY_LIMIT"], busy_timeout=30 if app.config["ASYNC_MODE"] == "threading" else 0.1)
+else:
+    rooms = InProcessRoomRegistry(app.config["HISTORY_LIMIT"])
+
+# hands out room codes (and takes them back once a room is deleted)
+codes = RoomCodeAllocator(length=4)
+
+# with the interned and compact wire formats, messages carry a small sender number instead of the sender's name
+senders = SenderInterner() if app.config["WIRE_FORMAT"] in ("interned", "compact") else None
+
+# word search over each room's history. It holds as many messages as the history does, so old messages leave the index along with the history
+# NOTE: the index lives in this process, so with several worker processes it only covers the messages sent through this worker (plus whatever the room held when this worker first needed its index)
+# NOTE: a room's index is built from its stored history the first time it's needed, so rooms restored from a snapshot are searchable again after a restart
+search_index = SearchIndex(app.config["HISTORY_LIMIT"], load=lambda room: rooms.history(room, None, app.config["HISTORY_LIMIT"])[0])
+
+# clean up everything that belongs to a room once it has been deleted
+def release_room(room):
+    codes.release(room)
+    search_index.forget(room)
+    if senders:
+        senders.forget(room)
+
+# deletes rooms that were never joined or were left empty for too long, and gives their codes back
+# NOTE: with several worker processes, each worker reaps the rooms it created
+reaper = RoomReaper(socketio, rooms, app.config["EMPTY_ROOM_TTL"], app.config["ROOM_MAX_IDLE"], on_expire=release_room)
+
+# run a blocking function on a real OS thread and wait for it without holding up other connections
+# NOTE: with gevent/eventlet every handler shares one OS thread, so seconds of CPU and disk work in one green thread would freeze every client for that long. Their thread pools run the function on a separate OS thread, and only the waiting green thread is paused. With "threading" the caller is already its own OS thread
+def in_os_thread(function, *args):
+    if app.config["ASYNC_MODE"] == "gevent":
+        import gevent
+        return gevent.get_hub().threadpool.apply(function, args)
+    if app.config["ASYNC_MODE"] == "eventlet":
+        from eventlet import tpool
+        return tpool.execute(function, *args)
+    return function(*args)
+
+# snapshots keep rooms and their history across restarts
+# NOTE: only the in-process registry needs them, the sqlite registry already lives on disk
+def save_snapshot(offload=None):
+    try:
+        saved = write_snapshot(app.config["SNAPSHOT_PATH"], rooms, offload)
+        print(f"Saved {saved} rooms to {app.config['SNAPSHOT_PATH']}")
+    except Exception as error:
+        print(f"Failed to save snapshot: {error}")
+
+def snapshot_loop():
+    while True:
+        socketio.sleep(app.config["SNAPSHOT_INTERVAL"])
+        # NOTE: encoding and writing thousands of rooms takes seconds, see benchmarks/snapshot_restore.py
+        save_snapshot(offload=in_os_thread)
+
+if app.config["SNAPSHOT_PATH"] and isinstance(rooms, InProcessRoomRegistry):
+    # restored rooms have no members until people reconnect, so the reaper cleans up the ones nobody comes back to. They get the idle timeout rather than the short one for rooms nobody ever joined, since their members may take a while to notice the restart
+    # NOTE: their codes are reserved, so the allocator never hands them out for new rooms (and counts them as in use)
+    for code in read_snapshot(app.config["SNAPSHOT_PATH"], rooms):
+        codes.reserve(code)
+        reaper.track(code, app.config["ROOM_MAX_IDLE"])
+    print(f"Restored {len(rooms)} rooms from {app.config['SNAPSHOT_PATH']}")
+
+    socketio.start_background_task(snapshot_loop)
+    atexit.register(save_snapshot)
+
+# counters and latency histograms for every route and socket event, served in the prometheus format on "/metrics"
+# NOTE: with several worker processes every worker has its own numbers, so each one should be scraped
+metrics = Metrics()
+metrics.gauge("rooms", "Live chat rooms", lambda: rooms.stats()["rooms"])
+metrics.gauge("members", "Members connected across all rooms", lambda: rooms.stats()["members"])
+metrics.gauge("stored_messages", "Messages held in room history", lambda: rooms.stats()["messages"])
+if moderator:
+    for key, help in [("checked", "Messages screened by the moderation model"), ("flagged", "Messages flagged by the moderation model"), ("timed_out", "Messages not screened because their batch timed out"), ("failed", "Messages not screened because their batch failed"), ("skipped", "Messages not screened because too many were waiting"), ("pending", "Messages waiting for a moderation worker")]:
+        metrics.gauge(f"moderation_{key}", help, lambda key=key: moderator.stats()[key])
+
+# permanent message storage. Writes are queued and committed in batches by a background OS thread (a real one, even under gevent/eventlet), so socket handlers never wait on the disk
+store = SQLiteMessageStore(app.config["MESSAGE_DB"]) if app.config["MESSAGE_DB"] else NullMessageStore()
+
+# make sure queued messages get written before the server exits
+atexit.register(store.close)
+
+# with backpressure on, every member of a room gets their own bounded outbox, so one slow client can't grow server memory or hold up everyone else
+outbox = OutboundLimiter(socketio, app.config["OUTBOX_LIMIT"], app.config["OUTBOX_POLICY"]) if app.config["OUTBOX_LIMIT"] > 0 else None
+
+# limits how fast a single client can send messages
+limiter = RateLimiter(app.config["MESSAGE_RATE"], app.config["MESSAGE_BURST"]) if app.config["MESSAGE_RATE"] > 0 else None
+
+# send an event to everyone in a room
+def deliver(event, data, room):
+    if outbox:
+        outbox.deliver(event, data, room)
+    else:
+        socketio.emit(event, data, to=room)
 
-# this dictionary will house the chat rooms for the project
-rooms = {} 
+# in busy rooms, broadcasts can be buffered for a few milliseconds and sent as one batch instead of one frame per message
+coalescer = BroadcastCoalescer(socketio, app.config["COALESCE_WINDOW"], emit=deliver) if app.config["COALESCE_WINDOW"] > 0 else None
+
+# turn {"name": ..., "message": ...} into the compact [sender id, message] frame
+# NOTE: a sender's first message in a room also sends out a "roster" update, ahead of the message itself, so clients can always look the id up
+def pack(room, content):
+    sender_id, new = senders.intern(room, content["name"])
+    if new:
+        deliver("roster", {str(sender_id): content["name"]}, room)
+    # stored messages also carry their id (see message())
+    return [sender_id, content["message"], content["id"]] if "id" in content else [sender_id, content["message"]]
+
+# send a message to everyone in a room, through the coalescer when it's turned on
+# NOTE: join/leave notices go through here too, so they can never overtake messages still sitting in a batch
+def broadcast(room, content):
+    if senders:
+        content = pack(room, content)
+
+    if coalescer:
+        coalescer.publish(room, content)
+    elif outbox:
+        outbox.deliver("message", content, room)
+    else:
+        send(content, to=room)
 
 # create home route for website
 @app.route("/", methods=["GET", "POST"])
+@metrics.timed("http", "home")
 def home():
     # always start off with a new session
-    session.clear()
+    # NOTE: clearing a session that is already empty would still send a cookie back, on every single visit to the page
+    if session:
+        session.clear()
 
     # grab form data if POST request
     if request.method == "POST":
@@ -45,9 +263,18 @@ def home():
 
         # create a new room if user wants to make one
         if create != False:
-            room = gen_room(4, rooms)
+            # NOTE: another worker process has its own allocator and could already be using this code, so keep going until create succeeds
+            # NOTE: codes that turned out to be taken are given back afterwards (not straight away, or the allocator could hand the same ones back and forth while they stay taken)
+            taken = []
+            room = codes.allocate()
+            while not rooms.create(room):
+                taken.append(room)
+                room = codes.allocate()
+            for code in taken:
+                codes.release(code)
 
-            rooms[room] = {"members": 0, "messages": []}
+            # if nobody ever connects to the room, the reaper cleans it up later
+            reaper.track(room)
 
         # if user is not making a new room, they must want to join an existing one. if they give incorrect room code then it doesn't exist
         elif code not in rooms:
@@ -61,10 +288,12 @@ def home():
         return redirect(url_for("room"))
 
     # if not post request, then just GET
-    return render_template("home.html")
+    # NOTE: the empty form looks the same for everyone, so it's only rendered once
+    return conditional(fragments.get("home", lambda: render_template("home.html")))
 
 # route to individual chat room
 @app.route("/room")
+@metrics.timed("http", "room")
 def room():
     # users should not be able to go into "/room" unless they have a legit name and room code
     room = session.get("room")
@@ -72,10 +301,55 @@ def room():
          return redirect(url_for("home"))
 
     # NOTE: adding messages allows the room to always populate with message history for the room (so long as there is someone in it). That way if a user refreshes, they don't lose their conversation history.
-    return render_template("room.html", code=room, messages=rooms[room]["messages"]) 
+    # only the newest page is embedded, so joining an old room is just as fast as joining a new one. Older messages are fetched on demand from the history route below
+    messages, cursor = rooms.history(room, None, app.config["HISTORY_PAGE_SIZE"])
+    return conditional(render_template("room.html", code=room, messages=messages, cursor=cursor))
+
+# paginated message history for a room (ex. /room/ABCD/history?before=120&limit=50)
+@app.route("/room/<code>/history")
+@metrics.timed("http", "room_history")
+def room_history(code):
+    # only members of the room can read its history
+    if session.get("room") != code or code not in rooms:
+         abort(404)
+
+    before = request.args.get("before", type=int)
+    limit = request.args.get("limit", app.config["HISTORY_PAGE_SIZE"], type=int)
+    limit = max(1, min(limit, app.config["HISTORY_LIMIT"]))
+
+    messages, cursor = rooms.history(code, before, limit)
+
+    # "before" is the cursor to use for the next (older) page, or None when the start of the history has been reached
+    return jsonify(messages=messages, before=cursor)
+
+# search a room's history (ex. /room/ABCD/search?q=hockey game&limit=20). prefix=1 also matches words starting with the last word of the query
+@app.route("/room/<code>/search")
+@metrics.timed("http", "room_search")
+def room_search(code):
+    if session.get("room") != code or code not in rooms:
+         abort(404)
+
+    query = request.args.get("q", "")
+    before = request.args.get("before", type=int)
+    prefix = request.args.get("prefix", "0") == "1"
+    limit = request.args.get("limit", app.config["HISTORY_PAGE_SIZE"], type=int)
+    limit = max(1, min(limit, app.config["HISTORY_LIMIT"]))
+
+    # results are newest first. One extra id is asked for to find out if there is another page
+    ids = search_index.search(code, query, limit + 1, before, prefix)
+    messages = rooms.get_messages(code, ids[:limit])
+
+    # "before" is the cursor for the next page of results, or None when there are no more
+    return jsonify(messages=messages, before=ids[limit - 1] if len(ids) > limit else None)
+
+# metrics for prometheus (or anything else that reads its text format) to scrape
+@app.route("/metrics")
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
 
 # socket connection
 @socketio.on("connect")
+@metrics.timed("socket", "connect")
 def connect(auth):
      # look in current session for name and code
      room = session.get("room")
@@ -85,42 +359,60 @@ def connect(auth):
      if not room or not name:
           return
      
-     # if they have a room but for some reason its not a valid one, we can force the user out of it
-     if room not in rooms:
+     # update room user count as soon as the user connects. If they have a room but for some reason its not a valid one (or it was just deleted), we can force the user out of it
+     # NOTE: checking "room in rooms" and then joining would be two steps, and the room could be deleted in between. rooms.join does both at once
+     if not rooms.join(room):
           leave_room(room)
           return
-     
+
+     # remember the count was updated, so disconnect only undoes joins that actually happened
+     session["joined"] = True
+     reaper.touch(room)
+
      # join user to chat room
      join_room(room)
 
+     # with numbered senders, the new member first needs every sender number already used in the room
+     if senders:
+          emit("roster", senders.roster(room))
+
      # send json data to the room (can send to certain users, everyone, etc.)
      content = {
           "name": name, 
           "message": " has entered the chat room"
      }   
 
-     send(content, to=room)
+     broadcast(room, content)
      print(f"{name} entered room {room}")
 
-     # update room user count only after user connects and joins a room
-     rooms[room]["members"] += 1
-     print(f"{name} joined room {room}")
-
 
 # socket disconnection
 @socketio.on("disconnect")
-def disconnect():
+@metrics.timed("socket", "disconnect")
+def disconnect(reason=None): # NOTE: newer versions of python-socketio pass the reason the client disconnected
      room = session.get("room")
      name = session.get("name")
      leave_room(room)
 
+     if outbox:
+          outbox.forget(request.sid)
+     if limiter:
+          limiter.forget(request.sid)
+
+     # a connection that never made it into a room has nothing to undo
+     if not session.pop("joined", False):
+          return
+
     # update room count (or remove room is no one is there anymore)
-     if room in rooms:
-          rooms[room]["members"] -= 1
-          if rooms[room]["members"] <= 0:
-               del rooms[room]
-               print(f"Room {room} has been deleted")
+     remaining = rooms.leave(room)
+     if remaining is not None and remaining <= 0:
+          release_room(room)
+          reaper.forget(room)
+          print(f"Room {room} has been deleted")
+          print(f"{name} left room {room}")
 
+          # nobody is left to tell
+          return
 
      # we are sending json data with name and message
      content = {
@@ -128,31 +420,52 @@ def disconnect():
           "message": " has left the chat room"
      }   
 
-     send(content, to=room)
+     broadcast(room, content)
      print(f"{name} left room {room}")
 
 # defines how the server can send messages made from users
 @socketio.on("message")
+@metrics.timed("socket", "message")
 def message(data):
      room = session.get("room")
      if room not in rooms:
           return
+
+     # clients sending faster than the allowed rate get their extra messages dropped (and are told so)
+     if limiter and not limiter.allow(request.sid):
+          emit("rate_limited", {"message": "You are sending messages too quickly"})
+          return
      
+     # NOTE: clients can send anything, so the message is turned into text before it's stored, indexed or sent (ex. {"data": 123} becomes "123")
+     text = data.get("data") if isinstance(data, dict) else None
+     if text is None:
+          return
+
      content = {
           "name": session.get("name"),
-          "message": data["data"],
+          "message": str(text),
      }
 
      print(content)
 
-    # all users in the room receive this message
-     send(content, to=room)
+     # NOTE: the room keeps a capped copy for page loads, and the store keeps every message permanently
+     # NOTE: the message is added to the room first, so it goes out with the id it was stored under. Clients use the id to find it again later (ex. when moderation flags it)
+     stored = rooms.add_message(room, content)
+     if stored:
+          search_index.add(room, stored)
 
-     # NOTE: this is where the messages would be added to a database or server for permanent storage. 
+    # all users in the room receive this message
+     broadcast(room, stored or content)
+     reaper.touch(room)
+     store.save(room, content)
 
-     rooms[room]["messages"].append(content)
+     # the message is already out, moderation catches up with it a few milliseconds later
+     if moderator and stored:
+          moderator.submit(room, stored)
 
 if __name__ == "__main__":
     # this will start the dev server.
-    # NOTE: this command should only be used for dev purposes only, not production!
+    # NOTE: this command should only be used for dev purposes only, not production! (use serve.py instead)
+    # templates reload while developing, so rendered fragments must not stick around
+    fragments.enabled = False
     socketio.run(app, debug=True) # debug attribute supports auto reload when server code changes
@@ -0,0 +1,36 @@
+# production entry point for the chat app: python serve.py
+# the dev server in main.py gives every websocket its own OS thread, which runs out of steam at a few hundred connections. Here the app runs on an async worker instead, where every connection is a green thread that only gives up control while waiting on the network
+import os
+
+# NOTE: monkey patching swaps the blocking parts of the standard library (sockets, threads, time.sleep, queues, etc.) for cooperative versions. It has to happen before anything else is imported, otherwise modules keep references to the blocking originals
+ASYNC_MODE = os.environ.setdefault("CHAT_ASYNC_MODE", "gevent")
+
+if ASYNC_MODE == "gevent":
+    from gevent import monkey
+    monkey.patch_all()
+elif ASYNC_MODE == "eventlet":
+    import eventlet
+    eventlet.monkey_patch()
+else:
+    raise SystemExit(f"CHAT_ASYNC_MODE must be 'gevent' or 'eventlet' for serve.py, not {ASYNC_MODE!r}")
+
+import signal
+
+from main import app, socketio
+
+# NOTE: cleanup registered with atexit (the final snapshot, flushing queued messages to disk) only runs on a normal exit, so a SIGTERM from a process manager stops the server the way socketio.stop() does. socketio.run then returns, and the process exits normally
+# NOTE: an exception raised straight from a signal handler lands in whichever green thread happens to be running. With gevent that is usually the hub, and the server carries on as if nothing happened, so there the handler runs as its own green thread instead (stopping the server closes the listening socket and gives open connections a moment before they are closed)
+if ASYNC_MODE == "gevent":
+    import gevent
+
+    gevent.signal_handler(signal.SIGTERM, socketio.stop)
+else:
+    # eventlet's stop raises SystemExit, which eventlet hands to the main green thread
+    signal.signal(signal.SIGTERM, lambda signum, frame: socketio.stop())
+
+if __name__ == "__main__":
+    host = os.environ.get("CHAT_HOST", "0.0.0.0")
+    port = int(os.environ.get("CHAT_PORT", "5000"))
+    print(f"Serving chat app with {ASYNC_MODE} on {host}:{port}")
+
+    socketio.run(app, host=host, port=port)
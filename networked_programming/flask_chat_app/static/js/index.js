@@ -1,19 +1,55 @@
-let socketio = io();
+// the msgpack parser is only loaded (see base.html) when the server uses the compact wire format
+let socketio = io(typeof msgpackParser !== "undefined" ? { parser: msgpackParser } : {});
+
+// sender id -> name, for compact frames that carry [sender id, message] instead of the full name
+const roster = {};
+
+// compact frames are turned back into the usual {id, name, message} shape
+const unpack = (data) => (Array.isArray(data) ? { id: data[2], name: roster[data[0]], message: data[1] } : data);
 
 const messages = document.getElementById("messages");
 
-const createMessage = (name, msg) => {
-	const content = `
-     <div class="text">
+// cursor of the oldest message currently on screen (null when the full history is loaded)
+let historyCursor = null;
+
+// names and messages are whatever users typed, so they're escaped before going into html (otherwise a message like <img onerror=...> would run in everyone's browser)
+const escapeHtml = (text) =>
+	String(text ?? "").replace(/[&<>"']/g, (char) => ({ "&": "&amp;", "<": "&lt;", ">": "&gt;", '"': "&quot;", "'": "&#39;" })[char]);
+
+// stored messages carry the id the server keeps them under, so they can be found again (ex. by the "flagged" event). join/leave notices have none
+const messageHtml = (name, msg, id) => `
+     <div class="text"${id === undefined || id === null ? "" : ` data-id="${escapeHtml(id)}"`}>
         <span>
-            <strong>${name}</strong>: ${msg}
+            <strong>${escapeHtml(name)}</strong>: ${escapeHtml(msg)}
         </span>
         <span class="muted">
             ${new Date().toLocaleString()}
         </span>
     </div>
     `;
-	messages.innerHTML += content;
+
+const createMessage = (name, msg, id, prepend = false) => {
+	const content = messageHtml(name, msg, id);
+	if (prepend) messages.insertAdjacentHTML("afterbegin", content);
+	else messages.insertAdjacentHTML("beforeend", content);
+};
+
+// render a page of history. older pages are added above what is already on screen
+const loadHistory = (page, older = false) => {
+	const list = older ? [...page.messages].reverse() : page.messages;
+	list.forEach((msg) => createMessage(msg.name, msg.message, msg.id, older));
+
+	historyCursor = page.before;
+	document.getElementById("older-btn").hidden = historyCursor === null;
+};
+
+const loadOlder = async (code) => {
+	if (historyCursor === null) return;
+
+	const response = await fetch(`/room/${code}/history?before=${historyCursor}`);
+	if (!response.ok) return;
+
+	loadHistory(await response.json(), true);
 };
 
 const sendMessage = () => {
@@ -28,5 +64,39 @@ const sendMessage = () => {
 
 // listen for message event
 socketio.on("message", (data) => {
-	createMessage(data.name, data.message);
+	data = unpack(data);
+	createMessage(data.name, data.message, data.id);
+});
+
+// new sender ids (or the whole roster right after joining)
+socketio.on("roster", (entries) => {
+	Object.assign(roster, entries);
+});
+
+// when the server coalesces broadcasts, messages arrive as a list. they're turned into html together and added to the page in one go
+socketio.on("message_batch", (batch) => {
+	const content = batch
+		.map(unpack)
+		.map((data) => messageHtml(data.name, data.message, data.id))
+		.join("");
+	messages.insertAdjacentHTML("beforeend", content);
+});
+
+// the server skipped some messages because this client fell too far behind
+socketio.on("missed", (data) => {
+	messages.insertAdjacentHTML("beforeend", `<div class="text muted">You missed ${data.count} messages</div>`);
+});
+
+// the server dropped a message because this client sent too many too quickly
+socketio.on("rate_limited", (data) => {
+	messages.insertAdjacentHTML("beforeend", `<div class="text muted">${escapeHtml(data.message)}</div>`);
+});
+
+// the moderation model flagged a message. the message with that id is greyed out and labelled
+socketio.on("flagged", (data) => {
+	const match = messages.querySelector(`.text[data-id="${CSS.escape(String(data.id))}"]`);
+	if (!match || match.classList.contains("flagged")) return;
+
+	match.classList.add("flagged");
+	match.querySelector("span").insertAdjacentHTML("beforeend", ` <span class="muted">(flagged as ${escapeHtml(data.label)})</span>`);
 });
@@ -1,4 +1,44 @@
-from .utils import generate_unique_code
+from .utils import RoomCodeAllocator
+from .history import RoomHistory
+from .store import MessageStore, NullMessageStore, SQLiteMessageStore
+from .registry import RoomRegistry, InProcessRoomRegistry, SQLiteRoomRegistry
+from .coalescer import BroadcastCoalescer
+from .backpressure import TokenBucket, RateLimiter, OutboundLimiter
+from .reaper import RoomReaper
+from .metrics import Metrics, Counter, Histogram, Gauge
+from .wire import SenderInterner
+from .search import RoomIndex, SearchIndex
+from .snapshot import SnapshotRoom, read_snapshot, write_snapshot
+from .caching import StaticAssets, FragmentCache
+from .moderation import Moderator, load_pretrained
 
 # Dunder method __all__ explicitly defines the public API of a module. Each string in the list corresponds to the functions, classes, variables, etc. you want to make available to files when importing.
-__all__ = ["generate_unique_code"]
\ No newline at end of file
+__all__ = [
+    "RoomCodeAllocator",
+    "RoomHistory",
+    "MessageStore",
+    "NullMessageStore",
+    "SQLiteMessageStore",
+    "RoomRegistry",
+    "InProcessRoomRegistry",
+    "SQLiteRoomRegistry",
+    "BroadcastCoalescer",
+    "TokenBucket",
+    "RateLimiter",
+    "OutboundLimiter",
+    "RoomReaper",
+    "Metrics",
+    "Counter",
+    "Histogram",
+    "Gauge",
+    "SenderInterner",
+    "RoomIndex",
+    "SearchIndex",
+    "SnapshotRoom",
+    "read_snapshot",
+    "write_snapshot",
+    "StaticAssets",
+    "FragmentCache",
+    "Moderator",
+    "load_pretrained",
+]
\ No newline at end of file
@@ -0,0 +1,158 @@
+import threading
+import time
+from collections import deque
+
+# what happens to a slow client once its outbox is full
+POLICIES = ("drop_oldest", "collapse", "disconnect")
+
+# a classic token bucket: tokens drip in at "rate" per second up to "burst", and every event spends one. Short bursts are fine, but a client can't keep sending faster than the rate
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+
+    def allow(self) -> bool:
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+
+# one token bucket per socket session, for limiting inbound events
+class RateLimiter:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self._buckets = {}
+
+    def allow(self, sid: str) -> bool:
+        bucket = self._buckets.get(sid)
+        if bucket is None:
+            bucket = self._buckets[sid] = TokenBucket(self.rate, self.burst)
+        return bucket.allow()
+
+    # call when the session disconnects
+    def forget(self, sid: str) -> None:
+        self._buckets.pop(sid, None)
+
+
+# fans room broadcasts out to each member separately, so one member on a slow link can't make the server buffer without limit
+# NOTE: every connection has an outbound packet queue inside engineio, which keeps growing while the client is slow to read. As long as that queue is short, messages go straight into it. Once it's past "high_water", new messages wait in a small per-session outbox instead, and when that outbox is full the policy decides what to do:
+#   drop_oldest - throw away the oldest waiting message
+#   collapse    - same, but the client is told "you missed N messages" once it catches up
+#   disconnect  - cut the client off
+# NOTE: this only sees sessions connected to this process. Room messages are sent to each of them directly instead of through a room broadcast, so members connected to other worker processes would never get them. It can't be combined with a message queue (main.py refuses to start with both)
+class OutboundLimiter:
+    def __init__(self, socketio, limit: int, policy: str = "collapse", high_water: int = 64, interval: float = 0.05, namespace: str = "/"):
+        if policy not in POLICIES:
+            raise ValueError(f"policy must be one of {POLICIES}, not {policy!r}")
+
+        self.socketio = socketio
+        self.limit = limit # max messages waiting per session
+        self.policy = policy
+        self.high_water = high_water # engineio queue length at which a client counts as slow
+        self.interval = interval # seconds between attempts to drain outboxes
+        self.namespace = namespace
+
+        self._outboxes = {} # sid -> deque of (event, data) waiting to go out
+        self._missed = {} # sid -> messages dropped since the last "missed" notice
+        self._draining = set() # sids whose batch was taken off the outbox but hasn't been emitted yet
+        self._lock = threading.Lock()
+        self._task = None
+
+    # send an event to every member of a room
+    def deliver(self, event: str, data, room: str) -> None:
+        server = self.socketio.server
+        for sid, eio_sid in server.manager.get_participants(self.namespace, room):
+            self._push(sid, eio_sid, event, data)
+
+    # call when the session disconnects
+    def forget(self, sid: str) -> None:
+        with self._lock:
+            self._outboxes.pop(sid, None)
+            self._missed.pop(sid, None)
+            self._draining.discard(sid)
+
+    def _depth(self, eio_sid) -> int:
+        socket = self.socketio.server.eio.sockets.get(eio_sid)
+        return socket.queue.qsize() if socket else 0
+
+    def _push(self, sid, eio_sid, event, data):
+        overflow = False
+        with self._lock:
+            outbox = self._outboxes.get(sid)
+
+            # the usual case: nothing is waiting and the client is keeping up
+            # NOTE: while a batch is being drained the outbox is empty, but that batch still hasn't gone out. Sending this message right away would get it there first, so it waits in the outbox like the rest
+            if not outbox and sid not in self._draining and self._depth(eio_sid) < self.high_water:
+                send_now = True
+            else:
+                send_now = False
+                outbox = self._outboxes.setdefault(sid, deque())
+                overflow = len(outbox) >= self.limit
+
+                if overflow and self.policy == "disconnect":
+                    self._outboxes.pop(sid, None)
+                elif overflow:
+                    outbox.popleft()
+                    if self.policy == "collapse":
+                        self._missed[sid] = self._missed.get(sid, 0) + 1
+                    outbox.append((event, data))
+                else:
+                    outbox.append((event, data))
+
+                if self._task is None:
+                    self._task = self.socketio.start_background_task(self._drain_loop)
+
+        # NOTE: network calls happen outside the lock
+        if send_now:
+            self.socketio.emit(event, data, to=sid, namespace=self.namespace)
+        elif overflow and self.policy == "disconnect":
+            print(f"Disconnecting slow client {sid}")
+            self.socketio.server.disconnect(sid, namespace=self.namespace)
+
+    def _drain_loop(self):
+        while True:
+            self.socketio.sleep(self.interval)
+            try:
+                self._drain()
+            except Exception as error:
+                print(f"Failed to drain outboxes: {error}")
+
+    # move waiting messages into engineio for every client that has caught up
+    def _drain(self):
+        server = self.socketio.server
+        with self._lock:
+            sids = [sid for sid, outbox in self._outboxes.items() if outbox]
+
+        for sid in sids:
+            eio_sid = server.manager.eio_sid_from_sid(sid, self.namespace)
+            if eio_sid is None:
+                self.forget(sid)
+                continue
+
+            with self._lock:
+                outbox = self._outboxes.get(sid)
+                room_left = self.high_water - self._depth(eio_sid)
+                if not outbox or room_left <= 0:
+                    continue
+
+                missed = self._missed.pop(sid, 0)
+                batch = [outbox.popleft() for _ in range(min(room_left, len(outbox)))]
+                self._draining.add(sid)
+
+            try:
+                if missed:
+                    self.socketio.emit("missed", {"count": missed}, to=sid, namespace=self.namespace)
+                for event, data in batch:
+                    self.socketio.emit(event, data, to=sid, namespace=self.namespace)
+            finally:
+                # anything that arrived in the meantime is in the outbox, and goes out on the next pass
+                with self._lock:
+                    self._draining.discard(sid)
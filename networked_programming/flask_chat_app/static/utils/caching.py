@@ -0,0 +1,144 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+import threading
+
+from flask import Response
+
+# brotli is optional. Without it assets are only precompressed with gzip (pip install brotli to add it)
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# serves the css and js files from memory, already compressed, with a strong ETag and a long cache lifetime
+# NOTE: every asset is compressed once when it's loaded instead of on every request, so compression can use the slowest (smallest) settings for free
+# NOTE: urls built with url_for("static", ...) get "?v=<hash of the file>" added (see main.py), so a browser can keep a file for a year and still picks up a new version the moment the file changes
+class StaticAssets:
+    def __init__(self, folder: str, extensions: tuple = (".css", ".js"), max_age: int = 31536000):
+        self.folder = folder
+        self.extensions = extensions
+        self.max_age = max_age
+        self._assets = {} # filename (relative to folder, with "/") -> asset dict
+        self._lock = threading.Lock()
+        self._reloads = 0 # assets (re)loaded so far
+        self._seen = 0 # value of _reloads at the last refresh()
+
+        for root, _, files in os.walk(folder):
+            for file in files:
+                if file.endswith(extensions):
+                    filename = os.path.relpath(os.path.join(root, file), folder).replace(os.sep, "/")
+                    self._load(filename)
+        self._seen = self._reloads
+
+    def _load(self, filename: str) -> dict:
+        path = os.path.join(self.folder, filename)
+        with open(path, "rb") as file:
+            body = file.read()
+
+        version = hashlib.sha256(body).hexdigest()[:16]
+        encodings = {"identity": body, "gzip": gzip.compress(body, compresslevel=9, mtime=0)}
+        if brotli:
+            encodings["br"] = brotli.compress(body, quality=11)
+
+        asset = {
+            "version": version,
+            "mtime": os.path.getmtime(path),
+            "mimetype": mimetypes.guess_type(filename)[0] or "application/octet-stream",
+            # NOTE: a strong ETag promises byte for byte identical responses, so every encoding gets its own tag
+            "encodings": {encoding: (data, f"{version}-{encoding}") for encoding, data in encodings.items() if encoding == "identity" or len(data) < len(body)},
+        }
+        with self._lock:
+            self._assets[filename] = asset
+            self._reloads += 1
+        return asset
+
+    def _get(self, filename: str):
+        asset = self._assets.get(filename)
+        if asset is None:
+            return None
+
+        # NOTE: one stat per request means an edited file is picked up without restarting the server
+        try:
+            if os.path.getmtime(os.path.join(self.folder, filename)) != asset["mtime"]:
+                asset = self._load(filename)
+        except OSError:
+            return None
+        return asset
+
+    # reload every asset whose file changed on disk. Returns True if any asset got a new version since the last call
+    # NOTE: anything holding on to "?v=" urls (ex. a cached page head, see FragmentCache) has to be thrown away when this returns True, or pages keep pointing browsers at the old version
+    # NOTE: an asset request can be the one that notices the change and reloads the file, so this counts reloads instead of only looking at what it reloaded itself
+    def refresh(self) -> bool:
+        for filename in list(self._assets):
+            self._get(filename)
+        with self._lock:
+            changed = self._reloads != self._seen
+            self._seen = self._reloads
+        return changed
+
+    # hash of an asset's current contents, used as its "?v=" in urls (None for files that aren't served from here)
+    def version(self, filename: str):
+        asset = self._get(filename)
+        return asset["version"] if asset else None
+
+    # the response for an asset, or None when the file isn't one of the cached assets
+    def response(self, filename: str, request):
+        asset = self._get(filename)
+        if asset is None:
+            return None
+
+        # pick the smallest encoding the browser accepts
+        encodings = asset["encodings"]
+        encoding = "identity"
+        for candidate in ("br", "gzip"):
+            if candidate in encodings and request.accept_encodings[candidate]:
+                encoding = candidate
+                break
+        data, etag = encodings[encoding]
+
+        response = Response(data, mimetype=asset["mimetype"])
+        response.set_etag(etag)
+        response.vary.add("Accept-Encoding")
+        if encoding != "identity":
+            response.content_encoding = encoding
+
+        # only a versioned url can be cached "forever". A plain one is still cached, but checked with the server (which answers 304 while the file is unchanged)
+        if request.args.get("v") == asset["version"]:
+            response.cache_control.public = True
+            response.cache_control.max_age = self.max_age
+            response.cache_control.immutable = True
+        else:
+            response.cache_control.public = True
+            response.cache_control.no_cache = True
+
+        # answers "If-None-Match" with an empty 304 when the browser's copy is current
+        return response.make_conditional(request)
+
+
+# keeps rendered html for parts of templates that are the same for every user, so they are only rendered once
+# used from templates as: {% call cached("name") %} ...html... {% endcall %}
+# NOTE: only cache what doesn't depend on the request (ex. the page head). Anything with a name, code or error in it must stay outside
+class FragmentCache:
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._fragments = {}
+
+    # NOTE: jinja passes the body of the call block as "caller", and calling it renders the body
+    def __call__(self, key: str, caller):
+        return self.get(key, caller)
+
+    # the cached html for key, rendering it with render() the first time
+    def get(self, key: str, render):
+        if not self.enabled:
+            return render()
+
+        fragment = self._fragments.get(key)
+        if fragment is None:
+            # NOTE: two requests can render the same fragment at once, but setdefault makes sure they both end up with the same copy
+            fragment = self._fragments.setdefault(key, render())
+        return fragment
+
+    def clear(self) -> None:
+        self._fragments.clear()
@@ -0,0 +1,42 @@
+import threading
+
+# buffers outgoing messages per room and sends everything that piled up during a short window (ex. 20ms) as one batched event. A room with 500 members getting 50 messages a second goes from 25,000 tiny frames a second down to 500 * (1 / window) bigger ones
+class BroadcastCoalescer:
+    def __init__(self, socketio, window: float, event: str = "message_batch", emit=None):
+        self.socketio = socketio
+        self.window = window # seconds between flushes
+        self.event = event # name of the event the batches are emitted as
+
+        # function(event, data, room) that sends a batch out. Defaults to a plain room broadcast
+        self._emit = emit or (lambda event, data, room: socketio.emit(event, data, to=room))
+
+        self._pending = {} # room code -> list of messages waiting to go out
+        self._lock = threading.Lock()
+        self._task = None
+
+    # queue a message for the room. It goes out with the next flush
+    def publish(self, room: str, content: dict) -> None:
+        with self._lock:
+            self._pending.setdefault(room, []).append(content)
+
+            # NOTE: the flush loop is started by the first message rather than at import, so it runs under whichever async mode the server ended up using
+            if self._task is None:
+                self._task = self.socketio.start_background_task(self._run)
+
+    # send every buffered batch right now
+    def flush(self) -> None:
+        # swap the buffer out under the lock, then emit without holding it so publishers never wait on the network
+        with self._lock:
+            pending, self._pending = self._pending, {}
+
+        for room, batch in pending.items():
+            self._emit(self.event, batch, room)
+
+    def _run(self):
+        while True:
+            # NOTE: socketio.sleep cooperates with gevent/eventlet, where time.sleep might not
+            self.socketio.sleep(self.window)
+            try:
+                self.flush()
+            except Exception as error:
+                print(f"Failed to flush message batches: {error}")
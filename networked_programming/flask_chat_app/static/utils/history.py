@@ -0,0 +1,71 @@
+from collections import deque
+from itertools import islice
+
+# a capped message log for a single chat room. Once the limit is reached the oldest messages fall off the front (ie. a ring buffer), so memory per room stays flat no matter how long the room has been alive
+class RoomHistory:
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._messages = deque(maxlen=limit)
+
+        # every message gets an increasing id, which doubles as the cursor used for pagination
+        self._next_id = 0
+
+    # rebuild a history from saved messages (ex. from a snapshot)
+    @classmethod
+    def restore(cls, limit: int, messages: list, next_id: int) -> "RoomHistory":
+        history = cls(limit)
+        history._messages.extend(messages)
+        history._next_id = next_id
+        return history
+
+    # the id the next message will get
+    @property
+    def next_id(self) -> int:
+        return self._next_id
+
+    def __len__(self) -> int:
+        return len(self._messages)
+
+    def __iter__(self):
+        return iter(self._messages)
+
+    # store a message and return the stored copy (which now includes its id)
+    def append(self, content: dict) -> dict:
+        entry = {"id": self._next_id, **content}
+        self._next_id += 1
+        self._messages.append(entry)
+        return entry
+
+    # newest messages in the room, oldest first (so they can be rendered top to bottom)
+    def latest(self, limit: int) -> list:
+        return self.before(None, limit)
+
+    # up to "limit" messages that are older than the message with id "cursor" (or the newest messages if there is no cursor)
+    def before(self, cursor, limit: int) -> list:
+        if not self._messages or limit <= 0:
+            return []
+
+        # NOTE: ids inside the deque are contiguous, so the position of a cursor can be calculated instead of searched for
+        first_id = self._messages[0]["id"]
+        end = len(self._messages) if cursor is None else max(0, min(cursor - first_id, len(self._messages)))
+
+        # walk from the newest end, since pages are almost always near the end of the room
+        skip = len(self._messages) - end
+        page = list(islice(reversed(self._messages), skip, skip + limit))
+        page.reverse()
+        return page
+
+    # the messages with the given ids that are still in the history, in the order asked for
+    def get(self, ids: list) -> list:
+        if not self._messages:
+            return []
+
+        # NOTE: ids are contiguous, so every lookup is a direct index rather than a search
+        first_id = self._messages[0]["id"]
+        return [self._messages[i - first_id] for i in ids if 0 <= i - first_id < len(self._messages)]
+
+    # id to pass as "before" to get the page older than this one (None when there is nothing older left)
+    def cursor_for(self, page: list):
+        if not page or page[0]["id"] <= self._messages[0]["id"]:
+            return None
+        return page[0]["id"]
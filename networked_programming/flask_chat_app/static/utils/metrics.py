@@ -0,0 +1,138 @@
+import functools
+import threading
+import time
+from bisect import bisect_left
+
+from werkzeug.exceptions import HTTPException
+
+# a tiny Prometheus style metrics collection (counters, histograms and gauges) plus a "/metrics" text renderer
+# NOTE: recording is kept as cheap as possible (a lock, a binary search and a few additions), so it can stay on in production. Anything expensive, like counting rooms and messages, is only worked out when "/metrics" is actually scraped
+
+# default latency buckets in seconds (0.5ms up to 10s)
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values = {} # label values -> count
+        self._lock = threading.Lock()
+
+    def inc(self, labels: tuple = (), amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in self._values.items():
+                lines.append(f"{self.name}{_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        self._series = {} # label values -> [count per bucket (+ one for +Inf), sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, labels: tuple = ()) -> None:
+        # NOTE: only the single bucket the value falls in is counted here. The running totals prometheus expects are added up when rendering instead of on every observation
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = [(labels, list(counts), total) for labels, (counts, total) in self._series.items()]
+
+        for labels, counts, total in snapshot:
+            running = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                running += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                bucket_labels = _labels(self.labelnames, labels, f'le="{le}"')
+                lines.append(f"{self.name}_bucket{bucket_labels} {running}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {total}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {running}")
+        return lines
+
+
+# a value that is read from a function whenever metrics are scraped
+class Gauge:
+    def __init__(self, name: str, help: str, function):
+        self.name = name
+        self.help = help
+        self.function = function
+
+    def render(self) -> list:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge", f"{self.name} {self.function()}"]
+
+
+# every metric of the chat app, plus the decorator that times routes and socket handlers
+class Metrics:
+    def __init__(self, prefix: str = "chat"):
+        self.prefix = prefix
+        self._metrics = []
+
+        self.http_requests = self.add(Counter(f"{prefix}_http_requests_total", "HTTP requests handled, by route", ("route",)))
+        self.http_errors = self.add(Counter(f"{prefix}_http_errors_total", "HTTP requests that raised an exception, by route", ("route",)))
+        self.http_latency = self.add(Histogram(f"{prefix}_http_request_duration_seconds", "Time spent handling HTTP requests, by route", ("route",)))
+        self.socket_events = self.add(Counter(f"{prefix}_socket_events_total", "Socket events handled, by event", ("event",)))
+        self.socket_errors = self.add(Counter(f"{prefix}_socket_errors_total", "Socket events that raised an exception, by event", ("event",)))
+        self.socket_latency = self.add(Histogram(f"{prefix}_socket_event_duration_seconds", "Time spent handling socket events, by event", ("event",)))
+
+    def add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def gauge(self, name: str, help: str, function) -> Gauge:
+        return self.add(Gauge(f"{self.prefix}_{name}", help, function))
+
+    # decorator that counts and times a function. kind is "http" (name is the route) or "socket" (name is the event)
+    def timed(self, kind: str, name: str):
+        counter, errors, latency = {
+            "http": (self.http_requests, self.http_errors, self.http_latency),
+            "socket": (self.socket_events, self.socket_errors, self.socket_latency),
+        }[kind]
+        labels = (name,)
+
+        def decorator(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return function(*args, **kwargs)
+                except HTTPException:
+                    raise # ex. abort(404), which is a normal response rather than a failure
+                except Exception:
+                    errors.inc(labels)
+                    raise
+                finally:
+                    latency.observe(time.perf_counter() - start, labels)
+                    counter.inc(labels)
+            return wrapper
+        return decorator
+
+    # everything in the prometheus text format
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
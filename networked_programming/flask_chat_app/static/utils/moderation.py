@@ -0,0 +1,258 @@
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# screens chat messages with a text classification model (ex. the sentiment or toxic comment models from chatbot_demo/main.py) without ever running the model inside a socket handler
+# NOTE: one forward pass of a transformer takes tens of milliseconds, and it holds the cpu the whole time. Inline in message(), that would stall every other connection on the event loop. Instead:
+#   message() -> Moderator.submit()   just appends to a list, so the handler returns right away
+#   collector (background task)       every "window" seconds, cuts everything that piled up (from every room) into batches of up to "batch_size"
+#   worker processes                  run the model on a whole batch at once, which costs far less per message than one message at a time
+#   collector                         emits a "flagged" event to the room for every message the model flagged
+# NOTE: moderation fails open. Messages are delivered straight away as always, and a batch that errors, times out or can't be queued simply isn't screened (the counts show up in stats())
+# NOTE: if the model can't be loaded at all (ex. a typo in the model name), moderation turns itself off and says so once, rather than starting worker after worker that fail the same way. Workers that crash later on (ex. out of memory) are replaced, but only after a wait that doubles every time it happens in a row
+
+
+# --- runs inside the worker processes ---
+
+# the tokenizer and model of this worker process, set up once by _start_worker
+_tokenizer = None
+_model = None
+
+# the default loader: a pretrained model from the huggingface hub (or its local cache)
+def load_pretrained(model_name: str):
+    from transformers import AutoTokenizer, AutoModelForSequenceClassification
+
+    return AutoTokenizer.from_pretrained(model_name), AutoModelForSequenceClassification.from_pretrained(model_name)
+
+def _start_worker(loader, model_name: str, threads: int):
+    global _tokenizer, _model
+
+    # NOTE: torch is only ever imported in the workers, so the web process stays small and never competes with them for cpu
+    import torch
+
+    # every worker gets its share of the cores, rather than each one trying to use all of them at once
+    torch.set_num_threads(threads)
+    _tokenizer, _model = loader(model_name)
+    _model.eval()
+
+# classify a batch of texts. Returns (label, probability) for each one
+def _classify(texts: list, max_length: int) -> list:
+    import torch
+    import torch.nn.functional as F
+
+    # NOTE: padding=True pads to the longest message in this batch (not to max_length), so short chat messages stay cheap
+    batch = _tokenizer(texts, padding=True, truncation=True, max_length=max_length, return_tensors="pt")
+    with torch.inference_mode():
+        predictions = F.softmax(_model(**batch).logits, dim=1)
+
+    scores, labels = predictions.max(dim=1)
+    return [(_model.config.id2label[label], score) for label, score in zip(labels.tolist(), scores.tolist())]
+
+
+# --- runs in the web process ---
+
+class Moderator:
+    def __init__(self, socketio, model_name: str, flagged_labels: tuple = ("NEGATIVE", "toxic"), threshold: float = 0.9, batch_size: int = 32, window: float = 0.01, timeout: float = 2.0, workers: int = 1, max_pending: int = 10000, max_length: int = 128, loader=load_pretrained, on_flagged=None):
+        self.socketio = socketio
+        self.model_name = model_name
+        self.flagged_labels = set(flagged_labels) # labels that count as flagged (when their probability is at least "threshold")
+        self.threshold = threshold
+        self.batch_size = batch_size # max messages per model call
+        self.window = window # seconds between collector passes (ie. how long a message can wait for its batch to fill up)
+        self.timeout = timeout # seconds a batch gets before it's given up on
+        self.workers = workers
+        self.max_pending = max_pending # messages allowed to wait for a worker. Past this, new messages go through unscreened
+        self.max_length = max_length # tokens per message the model looks at (longer messages are cut off)
+        self.loader = loader # function(model_name) -> (tokenizer, model), run once in every worker. Must be a module level function so it can be sent to the workers
+        self.max_backoff = 60 # most seconds to wait before replacing crashed workers
+
+        # function(room, content, label, score) called for every flagged message. Defaults to a "flagged" event to the room
+        self._on_flagged = on_flagged or self._emit_flagged
+
+        self._pending = [] # (room, content) waiting for a batch
+        self._in_flight = {} # future -> (batch, deadline)
+        self._results = [] # (batch, results or None) finished by the workers, waiting to be handled by the collector
+        self._stats = {"checked": 0, "flagged": 0, "timed_out": 0, "failed": 0, "skipped": 0, "batches": 0}
+        self._lock = threading.Lock()
+        self._executor = None
+        self._warm_up = None # future of the first batch, done once the workers have loaded the model
+        self._task = None
+        self._loaded = False # whether any pool ever loaded the model
+        self._disabled = False # the model couldn't be loaded, so nothing is screened anymore
+        self._crashes = 0 # pools that broke in a row (sets how long to wait before the next one)
+        self._restart_at = None # time.monotonic() when a crashed pool gets replaced
+
+        self._start_pool()
+
+    def _start_pool(self):
+        # NOTE: the workers are forked and the model is loaded right away (by the warm up batch), so the first real message doesn't wait for a model to load. This is also why the moderator is created early on, before the rest of the app starts any threads
+        threads = max(1, (os.cpu_count() or 1) // self.workers)
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("fork"),
+            initializer=_start_worker,
+            initargs=(self.loader, self.model_name, threads),
+        )
+        self._warm_up = self._executor.submit(_classify, ["warm up"], self.max_length)
+
+    # hand a message over for screening. Never blocks
+    # NOTE: content is the message as the room stored it, so a flagged event can say exactly which message it means by its "id"
+    def submit(self, room: str, content: dict) -> None:
+        with self._lock:
+            if self._disabled or len(self._pending) >= self.max_pending:
+                self._stats["skipped"] += 1
+                return
+
+            self._pending.append((room, content))
+
+            # NOTE: started by the first message rather than at import, so it runs under whichever async mode the server ended up using
+            if self._task is None:
+                self._task = self.socketio.start_background_task(self._run)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self._stats, "pending": len(self._pending), "in_flight": sum(len(batch) for batch, _ in self._in_flight.values())}
+
+    def _run(self):
+        while True:
+            # NOTE: socketio.sleep cooperates with gevent/eventlet, where time.sleep might not
+            self.socketio.sleep(self.window)
+            try:
+                self.collect()
+            except Exception as error:
+                print(f"Moderation pass failed: {error}")
+
+    # one collector pass: send out new batches, handle finished ones and give up on late ones
+    def collect(self) -> None:
+        self._dispatch()
+        self._handle_results()
+        self._expire()
+
+    def _dispatch(self):
+        if self._disabled:
+            return
+
+        # after a crash, messages wait here until it's time to start new workers
+        if self._executor is None:
+            if time.monotonic() < self._restart_at:
+                return
+            self._start_pool()
+
+        # NOTE: while the model is still loading, messages keep waiting here (where they get merged into full batches) rather than using up their timeout in the pool's queue
+        if not self._warm_up.done():
+            return
+
+        error = self._warm_up.exception()
+        if error is not None:
+            if self._loaded:
+                self._crashed()
+            else:
+                self._disable(f"could not load {self.model_name}: {error!r}")
+            return
+        self._loaded = True
+
+        with self._lock:
+            # NOTE: at most two batches per worker are queued at once (one running, one ready to go). Anything beyond that keeps waiting here, where it can still be merged into fuller batches, instead of in the pool's queue where it would only go stale
+            room_for = max(0, 2 * self.workers - len(self._in_flight))
+            count = min(len(self._pending), room_for * self.batch_size)
+            batches = [self._pending[start:start + self.batch_size] for start in range(0, count, self.batch_size)]
+            del self._pending[:count]
+
+        for index, batch in enumerate(batches):
+            try:
+                future = self._executor.submit(_classify, [content["message"] for _, content in batch], self.max_length)
+            except BrokenProcessPool:
+                # a worker died (ex. ran out of memory). Fail open for this batch, and the rest wait for the new pool
+                with self._lock:
+                    self._stats["failed"] += len(batch)
+                    self._pending[:0] = [item for rest in batches[index + 1:] for item in rest]
+                self._crashed()
+                return
+
+            with self._lock:
+                self._in_flight[future] = (batch, time.monotonic() + self.timeout)
+                self._stats["batches"] += 1
+            future.add_done_callback(self._done)
+
+    # shut down a pool whose workers died, and schedule a new one
+    # NOTE: the new workers are forked from this process, which by now runs other threads too. Waiting longer after every crash in a row keeps that (and loading the model again) rare when something keeps killing them
+    def _crashed(self):
+        executor, self._executor = self._executor, None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+        delay = min(self.max_backoff, 2 ** self._crashes)
+        self._crashes += 1
+        self._restart_at = time.monotonic() + delay
+        print(f"Moderation workers crashed, starting new ones in {delay} seconds")
+
+    # stop screening for good. Messages keep being delivered as always
+    def _disable(self, reason: str):
+        executor, self._executor = self._executor, None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+        with self._lock:
+            self._disabled = True
+            self._stats["skipped"] += len(self._pending)
+            self._pending = []
+        print(f"Moderation is turned off, {reason}")
+
+    # NOTE: this runs on the pool's own thread, so it only records the result. Events are emitted from the collector, which runs under the server's async mode
+    def _done(self, future):
+        with self._lock:
+            entry = self._in_flight.pop(future, None)
+            if entry is None:
+                return # it already timed out
+
+            try:
+                self._results.append((entry[0], future.result()))
+            except Exception as error:
+                print(f"Moderation batch failed: {error}")
+                self._results.append((entry[0], None))
+
+    def _handle_results(self):
+        with self._lock:
+            results, self._results = self._results, []
+
+        flagged = []
+        for batch, labels in results:
+            if labels is None:
+                with self._lock:
+                    self._stats["failed"] += len(batch)
+                continue
+
+            # the workers are healthy again, so the next crash starts over with a short wait
+            self._crashes = 0
+            for (room, content), (label, score) in zip(batch, labels):
+                if label in self.flagged_labels and score >= self.threshold:
+                    flagged.append((room, content, label, score))
+
+            with self._lock:
+                self._stats["checked"] += len(batch)
+
+        with self._lock:
+            self._stats["flagged"] += len(flagged)
+
+        for room, content, label, score in flagged:
+            self._on_flagged(room, content, label, score)
+
+    def _expire(self):
+        now = time.monotonic()
+        with self._lock:
+            late = [future for future, (_, deadline) in self._in_flight.items() if deadline <= now]
+            for future in late:
+                batch, _ = self._in_flight.pop(future)
+                self._stats["timed_out"] += len(batch)
+
+        # NOTE: a batch that is already running can't be stopped, but one still waiting in the pool's queue is dropped. Cancelling runs _done, which takes the lock, so this happens after letting go of it
+        for future in late:
+            future.cancel()
+
+    def _emit_flagged(self, room, content, label, score):
+        self.socketio.emit("flagged", {"id": content.get("id"), "name": content["name"], "message": content["message"], "label": label, "score": round(score, 3)}, to=room)
+
+    def close(self) -> None:
+        if self._executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,98 @@
+import heapq
+import threading
+import time
+
+# deletes rooms nobody is using anymore:
+# - rooms that still have 0 members "empty_ttl" seconds after being created (ex. someone clicked create but never opened the socket, so disconnect never runs for them)
+# - rooms with no members and no activity (joins, messages) for "max_idle" seconds (ex. rooms restored from a snapshot that nobody came back to)
+# NOTE: a room that still has members is never deleted, no matter how quiet it is. Its members would stay in the socket.io room with a code that goes back to the allocator, so a new room handed that code would get their messages (and their disconnects). Such a room is deleted by the last member leaving, like any other
+# NOTE: instead of scanning every room on each pass, every room has one entry in a heap ordered by when it could next expire. Each pass only pops the entries that are due. If a room turned out to be active in the meantime, it is pushed back with its new deadline, so messages never touch the heap (they only update a timestamp)
+class RoomReaper:
+    def __init__(self, socketio, rooms, empty_ttl: float, max_idle: float, on_expire=None, interval: float = 1.0):
+        self.socketio = socketio
+        self.rooms = rooms # the RoomRegistry rooms are deleted from
+        self.empty_ttl = empty_ttl
+        self.max_idle = max_idle
+        self.on_expire = on_expire # function(code) called after a room is deleted (ex. to release its code)
+        self.interval = interval # seconds between passes
+
+        self._heap = [] # (deadline, code)
+        self._last_activity = {} # code -> time.monotonic() of the last join/message
+        self._ttl = {} # code -> seconds the room may sit empty
+        self._lock = threading.Lock()
+        self._task = None
+
+    # start tracking a room. It is deleted once it has had no members and no activity for "ttl" seconds (empty_ttl by default)
+    def track(self, code: str, ttl: float = None) -> None:
+        now = time.monotonic()
+        ttl = self.empty_ttl if ttl is None else ttl
+        with self._lock:
+            self._last_activity[code] = now
+            self._ttl[code] = ttl
+            heapq.heappush(self._heap, (now + ttl, code))
+
+            if self._task is None:
+                self._task = self.socketio.start_background_task(self._run)
+
+    # record activity in a room (cheap enough to call on every message)
+    def touch(self, code: str) -> None:
+        if code in self._last_activity:
+            self._last_activity[code] = time.monotonic()
+
+    # stop tracking a room that was deleted some other way (ex. the last member left)
+    def forget(self, code: str) -> None:
+        # NOTE: the heap entry stays behind and is simply skipped when it comes up
+        self._last_activity.pop(code, None)
+        self._ttl.pop(code, None)
+
+    # expire every room that is due. Returns the deleted codes
+    def reap(self, now: float = None) -> list:
+        now = time.monotonic() if now is None else now
+        due = []
+
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                _, code = heapq.heappop(self._heap)
+                last = self._last_activity.get(code)
+                if last is None or code not in self.rooms:
+                    self._last_activity.pop(code, None)
+                    self._ttl.pop(code, None)
+                    continue
+
+                # rooms with members are left alone, and only looked at again after the idle timeout
+                if self.rooms.members(code) > 0:
+                    heapq.heappush(self._heap, (max(last, now) + self.max_idle, code))
+                    continue
+
+                deadline = last + self._ttl[code]
+                if deadline > now:
+                    heapq.heappush(self._heap, (deadline, code))
+                    continue
+
+                due.append(code)
+
+        expired = []
+        for code in due:
+            # NOTE: someone can join an empty room between the check above and here. delete_if_empty checks again and deletes in one step, and a room that got a member after all is checked again later
+            if not self.rooms.delete_if_empty(code):
+                with self._lock:
+                    if code in self.rooms and code in self._last_activity:
+                        heapq.heappush(self._heap, (now + self.max_idle, code))
+                continue
+
+            self.forget(code)
+
+            expired.append(code)
+            if self.on_expire:
+                self.on_expire(code)
+            print(f"Room {code} has expired")
+
+        return expired
+
+    def _run(self):
+        while True:
+            self.socketio.sleep(self.interval)
+            try:
+                self.reap()
+            except Exception as error:
+                print(f"Failed to reap rooms: {error}")
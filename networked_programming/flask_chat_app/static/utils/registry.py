@@ -0,0 +1,303 @@
+import sqlite3
+import threading
+
+from .history import RoomHistory
+
+# base class for wherever chat rooms live (member counts and recent history). The app only talks to these methods, so rooms can be kept in this process's memory or somewhere every worker process can see
+class RoomRegistry:
+    def __init__(self, history_limit: int):
+        self.history_limit = history_limit
+
+    # register a new empty room. Returns False if the code is already taken
+    def create(self, code: str) -> bool:
+        raise NotImplementedError
+
+    def __contains__(self, code: str) -> bool:
+        raise NotImplementedError
+
+    # number of live rooms
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+    # add a member to an existing room. Returns False if the room does not exist (anymore)
+    def join(self, code: str) -> bool:
+        raise NotImplementedError
+
+    # remove a member, deleting the room once it is empty. Returns the members left, or None if the room did not exist
+    def leave(self, code: str):
+        raise NotImplementedError
+
+    def members(self, code: str) -> int:
+        raise NotImplementedError
+
+    # store a message in the room's capped history. Returns the stored message (with its id) or None if the room does not exist
+    def add_message(self, code: str, content: dict):
+        raise NotImplementedError
+
+    # up to "limit" messages older than the id "before" (newest when before is None), plus the cursor for the next older page
+    def history(self, code: str, before, limit: int) -> tuple:
+        raise NotImplementedError
+
+    # the messages with the given ids (skipping any that have dropped out of the history), in the order asked for
+    def get_messages(self, code: str, ids: list) -> list:
+        raise NotImplementedError
+
+    def delete(self, code: str) -> None:
+        raise NotImplementedError
+
+    # delete the room only if nobody is in it, checked and deleted in one step so a member joining at the same moment is never left inside a deleted room. Returns True if it was deleted
+    def delete_if_empty(self, code: str) -> bool:
+        raise NotImplementedError
+
+    # totals across every room: {"rooms": ..., "members": ..., "messages": ...}
+    def stats(self) -> dict:
+        raise NotImplementedError
+
+
+# rooms kept in a dictionary inside this process. Fastest option, but only works with a single server process
+# NOTE: with threaded or async workers, two handlers can update the same room at once (ex. "members += 1" is a read then a write, so two joins can turn into one). Every room is guarded by one of a fixed set of locks picked by hashing its code (ie. lock striping), so changes to one room never interleave while unrelated rooms almost never wait on each other
+class InProcessRoomRegistry(RoomRegistry):
+    def __init__(self, history_limit: int, stripes: int = 64):
+        super().__init__(history_limit)
+        self._rooms = {}
+        self._locks = [threading.Lock() for _ in range(stripes)]
+
+    def _lock(self, code):
+        return self._locks[hash(code) % len(self._locks)]
+
+    # a room's RoomHistory. Rooms restored from a snapshot hold a loader instead, which is only run the first time the history is needed (see snapshot.py)
+    def _history(self, room):
+        history = room["messages"]
+        if callable(history):
+            history = room["messages"] = history()
+        return history
+
+    def create(self, code):
+        with self._lock(code):
+            if code in self._rooms:
+                return False
+            self._rooms[code] = {"members": 0, "messages": RoomHistory(self.history_limit)}
+            return True
+
+    def __contains__(self, code):
+        return code in self._rooms
+
+    def __len__(self):
+        return len(self._rooms)
+
+    def join(self, code):
+        with self._lock(code):
+            room = self._rooms.get(code)
+            if room is None:
+                return False
+            room["members"] += 1
+            return True
+
+    def leave(self, code):
+        with self._lock(code):
+            room = self._rooms.get(code)
+            if room is None:
+                return None
+
+            room["members"] -= 1
+            if room["members"] <= 0:
+                del self._rooms[code]
+            return room["members"]
+
+    def members(self, code):
+        room = self._rooms.get(code)
+        return room["members"] if room else 0
+
+    def add_message(self, code, content):
+        with self._lock(code):
+            room = self._rooms.get(code)
+            return self._history(room).append(content) if room else None
+
+    def history(self, code, before, limit):
+        # NOTE: the lock is needed for reads too, since a deque can't be walked while another thread appends to it
+        with self._lock(code):
+            room = self._rooms.get(code)
+            if room is None:
+                return [], None
+
+            history = self._history(room)
+            messages = history.before(before, limit)
+            return messages, history.cursor_for(messages)
+
+    def get_messages(self, code, ids):
+        with self._lock(code):
+            room = self._rooms.get(code)
+            return self._history(room).get(ids) if room else []
+
+    def delete(self, code):
+        with self._lock(code):
+            self._rooms.pop(code, None)
+
+    def delete_if_empty(self, code):
+        with self._lock(code):
+            room = self._rooms.get(code)
+            if room is None or room["members"] > 0:
+                return False
+            del self._rooms[code]
+            return True
+
+    # [(code, encode(history))] for every room, for writing snapshots. The history can also be a snapshot loader that was never used
+    # NOTE: encode runs while holding the room's lock, so no message can be added halfway through
+    def export(self, encode) -> list:
+        exported = []
+        for code in list(self._rooms):
+            with self._lock(code):
+                room = self._rooms.get(code)
+                if room is not None:
+                    exported.append((code, encode(room["messages"])))
+        return exported
+
+    # put back a room from a snapshot. Nobody is connected after a restart, so it starts with 0 members
+    def restore(self, code, history) -> None:
+        with self._lock(code):
+            self._rooms[code] = {"members": 0, "messages": history}
+
+    def stats(self):
+        # NOTE: list() takes a snapshot, since rooms can be added or deleted while this runs
+        rooms = list(self._rooms.values())
+        return {
+            "rooms": len(rooms),
+            "members": sum(room["members"] for room in rooms),
+            "messages": sum(len(room["messages"]) for room in rooms),
+        }
+
+
+# rooms kept in a sqlite file in WAL mode, so any number of worker processes on the same machine share one consistent set of rooms. Every change is a single atomic statement or a short "BEGIN IMMEDIATE" transaction, so two workers can never both think they created the same room or lose a member count
+class SQLiteRoomRegistry(RoomRegistry):
+    def __init__(self, path: str, history_limit: int, busy_timeout: float = 30):
+        super().__init__(history_limit)
+        self.path = path
+        self.busy_timeout = busy_timeout # seconds to wait for another worker's write to finish before giving up
+
+        # NOTE: sqlite connections can't be shared between threads, so every thread gets its own
+        self._local = threading.local()
+
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS rooms (code TEXT PRIMARY KEY, members INTEGER NOT NULL, seq INTEGER NOT NULL)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS room_messages ("
+            "room TEXT NOT NULL, seq INTEGER NOT NULL, name TEXT, message TEXT, PRIMARY KEY (room, seq))"
+        )
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # isolation_level=None means autocommit, transactions are only opened where they are written out explicitly
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def create(self, code):
+        cursor = self._conn().execute("INSERT OR IGNORE INTO rooms (code, members, seq) VALUES (?, 0, 0)", (code,))
+        return cursor.rowcount == 1
+
+    def __contains__(self, code):
+        return self._conn().execute("SELECT 1 FROM rooms WHERE code = ?", (code,)).fetchone() is not None
+
+    def __len__(self):
+        return self._conn().execute("SELECT COUNT(*) FROM rooms").fetchone()[0]
+
+    def join(self, code):
+        cursor = self._conn().execute("UPDATE rooms SET members = members + 1 WHERE code = ?", (code,))
+        return cursor.rowcount == 1
+
+    def leave(self, code):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # NOTE: fetchall (not fetchone) so the RETURNING statement is finished before the commit
+            rows = conn.execute("UPDATE rooms SET members = members - 1 WHERE code = ? RETURNING members", (code,)).fetchall()
+            row = rows[0] if rows else None
+            if row is not None and row[0] <= 0:
+                self._delete(conn, code)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return row[0] if row else None
+
+    def members(self, code):
+        row = self._conn().execute("SELECT members FROM rooms WHERE code = ?", (code,)).fetchone()
+        return row[0] if row else 0
+
+    def add_message(self, code, content):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute("UPDATE rooms SET seq = seq + 1 WHERE code = ? RETURNING seq", (code,)).fetchall()
+            if not rows:
+                conn.execute("ROLLBACK")
+                return None
+
+            # the room's sequence number is the message id, and anything older than history_limit is trimmed right away
+            seq = rows[0][0] - 1
+            conn.execute(
+                "INSERT INTO room_messages (room, seq, name, message) VALUES (?, ?, ?, ?)",
+                (code, seq, content.get("name"), content.get("message")),
+            )
+            conn.execute("DELETE FROM room_messages WHERE room = ? AND seq <= ?", (code, seq - self.history_limit))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return {"id": seq, **content}
+
+    def history(self, code, before, limit):
+        conn = self._conn()
+        rows = conn.execute(
+            "SELECT seq, name, message FROM room_messages WHERE room = ? AND seq < ? ORDER BY seq DESC LIMIT ?",
+            (code, before if before is not None else 2**62, limit),
+        ).fetchall()
+        messages = [{"id": seq, "name": name, "message": message} for seq, name, message in reversed(rows)]
+
+        if not messages:
+            return messages, None
+        oldest = conn.execute("SELECT MIN(seq) FROM room_messages WHERE room = ?", (code,)).fetchone()[0]
+        return messages, (messages[0]["id"] if messages[0]["id"] > oldest else None)
+
+    def get_messages(self, code, ids):
+        if not ids:
+            return []
+
+        placeholders = ",".join("?" * len(ids))
+        rows = self._conn().execute(
+            f"SELECT seq, name, message FROM room_messages WHERE room = ? AND seq IN ({placeholders})", (code, *ids)
+        ).fetchall()
+        found = {seq: {"id": seq, "name": name, "message": message} for seq, name, message in rows}
+        return [found[i] for i in ids if i in found]
+
+    def delete(self, code):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        self._delete(conn, code)
+        conn.execute("COMMIT")
+
+    def delete_if_empty(self, code):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            deleted = conn.execute("DELETE FROM rooms WHERE code = ? AND members <= 0", (code,)).rowcount == 1
+            if deleted:
+                conn.execute("DELETE FROM room_messages WHERE room = ?", (code,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return deleted
+
+    def stats(self):
+        conn = self._conn()
+        rooms, members = conn.execute("SELECT COUNT(*), COALESCE(SUM(members), 0) FROM rooms").fetchone()
+        messages = conn.execute("SELECT COUNT(*) FROM room_messages").fetchone()[0]
+        return {"rooms": rooms, "members": members, "messages": messages}
+
+    def _delete(self, conn, code):
+        conn.execute("DELETE FROM rooms WHERE code = ?", (code,))
+        conn.execute("DELETE FROM room_messages WHERE room = ?", (code,))
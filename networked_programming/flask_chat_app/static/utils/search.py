@@ -0,0 +1,121 @@
+import re
+import threading
+from bisect import bisect_left, insort
+from collections import deque
+
+WORD = re.compile(r"\w+")
+
+# split text into lowercase words
+# NOTE: messages stored before they were checked (ex. restored from an old snapshot) may not be strings, so anything else is searched as its text
+def tokenize(text: str) -> list:
+    if not isinstance(text, str):
+        text = "" if text is None else str(text)
+    return WORD.findall(text.lower())
+
+
+# an inverted index for the messages of one room: every word points to the ids of the messages containing it (its "postings"), so a search only looks at messages that actually contain the words instead of scanning the whole history
+# NOTE: the index holds at most "limit" messages. Message ids only go up, so the oldest message is always at the front of every postings list, and evicting it is a popleft per word
+class RoomIndex:
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._postings = {} # word -> deque of message ids, oldest first
+        self._messages = deque() # (message id, words) in the order they were added
+        self._words = [] # every word in the index, sorted, for prefix search
+
+    def __len__(self) -> int:
+        return len(self._messages)
+
+    def add(self, message_id: int, text: str) -> None:
+        # NOTE: a message can reach the index twice when it was stored while the index was being built from the history, and ids only go up, so anything not newer than the last one is already in
+        if self._messages and message_id <= self._messages[-1][0]:
+            return
+
+        words = set(tokenize(text))
+        for word in words:
+            postings = self._postings.get(word)
+            if postings is None:
+                postings = self._postings[word] = deque()
+                insort(self._words, word)
+            postings.append(message_id)
+
+        self._messages.append((message_id, words))
+        while len(self._messages) > self.limit:
+            self._evict()
+
+    def _evict(self):
+        message_id, words = self._messages.popleft()
+        for word in words:
+            postings = self._postings[word]
+            postings.popleft()
+            if not postings:
+                del self._postings[word]
+                del self._words[bisect_left(self._words, word)]
+
+    # all ids for a word, or for every word starting with it when prefix is True
+    def _ids(self, word: str, prefix: bool) -> set:
+        if not prefix:
+            return set(self._postings.get(word, ()))
+
+        ids = set()
+        index = bisect_left(self._words, word)
+        while index < len(self._words) and self._words[index].startswith(word):
+            ids.update(self._postings[self._words[index]])
+            index += 1
+        return ids
+
+    # ids of messages containing every word of the query, newest first, older than "before" (when given)
+    # NOTE: with prefix=True the last word also matches longer words (ex. "hock" finds "hockey"), for search-as-you-type
+    def search(self, query: str, limit: int, before=None, prefix: bool = False) -> list:
+        words = list(dict.fromkeys(tokenize(query)))
+        if not words:
+            return []
+
+        # start with the rarest word, so the sets being intersected stay small. A prefix word always goes last
+        last = words.pop() if prefix else None
+        words.sort(key=lambda word: len(self._postings.get(word, ())))
+        if prefix:
+            words.append(last)
+
+        matches = None
+        for position, word in enumerate(words):
+            ids = self._ids(word, prefix and position == len(words) - 1)
+            matches = ids if matches is None else matches & ids
+            if not matches:
+                return []
+
+        if before is not None:
+            matches = [message_id for message_id in matches if message_id < before]
+        return sorted(matches, reverse=True)[:limit]
+
+
+# one RoomIndex per room
+class SearchIndex:
+    # load is a function(room) returning the messages a room already holds (ex. its history restored from a snapshot). A room's index is built from them the first time the room is searched or gets a message
+    def __init__(self, limit: int, load=None):
+        self.limit = limit
+        self.load = load
+        self._rooms = {}
+        self._lock = threading.Lock()
+
+    # the index for a room, built from its existing messages if there isn't one yet. Call with the lock held
+    def _index(self, room: str) -> RoomIndex:
+        index = self._rooms.get(room)
+        if index is None:
+            index = self._rooms[room] = RoomIndex(self.limit)
+            for message in self.load(room) if self.load else ():
+                index.add(message["id"], message["message"])
+        return index
+
+    # index a stored message (as returned by RoomRegistry.add_message, so it has its id)
+    def add(self, room: str, message: dict) -> None:
+        with self._lock:
+            self._index(room).add(message["id"], message["message"])
+
+    def search(self, room: str, query: str, limit: int, before=None, prefix: bool = False) -> list:
+        with self._lock:
+            return self._index(room).search(query, limit, before, prefix)
+
+    # call once a room is deleted
+    def forget(self, room: str) -> None:
+        with self._lock:
+            self._rooms.pop(room, None)
@@ -0,0 +1,115 @@
+import json
+import mmap
+import os
+import struct
+import zlib
+
+from .history import RoomHistory
+
+# saves every room of an InProcessRoomRegistry to one compact binary file, and brings them back after a restart
+# file layout:
+#   header     - magic bytes, number of rooms, where the index starts
+#   room data  - one zlib compressed JSON blob per room: [next message id, [messages...]]
+#   index      - per room: its code, plus where its blob is, how long it is and how many messages it holds
+# NOTE: restoring only reads the header and the index. The file is memory mapped, and a room's blob is only decompressed the first time someone actually opens that room, so thousands of rooms come back almost instantly
+
+MAGIC = b"CHATSNP1"
+HEADER = struct.Struct("<8sIQ") # magic, room count, index offset
+ENTRY = struct.Struct("<B") # length of the room code that follows
+LOCATION = struct.Struct("<QII") # blob offset, blob length, message count
+
+
+def _encode(next_id: int, messages: list) -> bytes:
+    return zlib.compress(json.dumps([next_id, messages], separators=(",", ":")).encode("utf-8"))
+
+
+# a room's history that is still sitting in the snapshot file. Calling it decompresses the history
+class SnapshotRoom:
+    def __init__(self, data, offset: int, length: int, count: int, limit: int):
+        self._data = data
+        self._offset = offset
+        self._length = length
+        self._count = count
+        self._limit = limit
+
+    # number of messages, without loading them
+    def __len__(self) -> int:
+        return self._count
+
+    def __call__(self) -> RoomHistory:
+        next_id, messages = json.loads(zlib.decompress(self.raw()))
+        return RoomHistory.restore(self._limit, messages, next_id)
+
+    # the compressed blob exactly as it is in the file
+    def raw(self) -> bytes:
+        return self._data[self._offset:self._offset + self._length]
+
+
+# write a snapshot of the registry to "path"
+# NOTE: the file is written under a temporary name and then renamed over the old one. A rename is atomic, so a crash halfway through can never leave a half written snapshot behind
+# NOTE: only copying the rooms out of the registry happens on the calling thread (a list copy per room, under that room's lock). Encoding, compressing and writing the file is the slow part, and it runs through "offload" when one is given, ex. a function that runs it on a real OS thread, so an async server's event loop keeps serving clients in the meantime
+def write_snapshot(path: str, registry, offload=None) -> int:
+    def copy(history):
+        # rooms nobody opened since the last restore are copied over as they are
+        if isinstance(history, SnapshotRoom):
+            return history.raw(), len(history)
+        return (history.next_id, list(history)), len(history)
+
+    rooms = registry.export(copy)
+    return offload(_write, path, rooms) if offload else _write(path, rooms)
+
+
+def _write(path: str, rooms: list) -> int:
+    temporary = f"{path}.tmp"
+    with open(temporary, "wb") as file:
+        file.write(HEADER.pack(MAGIC, 0, 0)) # filled in once the index offset is known
+
+        locations = []
+        for code, (data, count) in rooms:
+            blob = data if isinstance(data, bytes) else _encode(*data)
+            locations.append((code, file.tell(), len(blob), count))
+            file.write(blob)
+
+        index_offset = file.tell()
+        for code, offset, length, count in locations:
+            encoded_code = code.encode("utf-8")
+            file.write(ENTRY.pack(len(encoded_code)) + encoded_code + LOCATION.pack(offset, length, count))
+
+        file.seek(0)
+        file.write(HEADER.pack(MAGIC, len(locations), index_offset))
+
+        # make sure the data is really on disk before the rename makes it the current snapshot
+        file.flush()
+        os.fsync(file.fileno())
+
+    os.replace(temporary, path)
+    return len(locations)
+
+
+# restore every room from the snapshot at "path" into the registry. Returns the restored codes
+def read_snapshot(path: str, registry) -> list:
+    if not os.path.exists(path) or os.path.getsize(path) < HEADER.size:
+        return []
+
+    with open(path, "rb") as file:
+        # NOTE: the mapping stays valid after the file is closed (and even after a newer snapshot replaces the file), and the loaders keep it alive for as long as they need it
+        data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    magic, count, index_offset = HEADER.unpack_from(data, 0)
+    if magic != MAGIC:
+        raise ValueError(f"{path} is not a chat snapshot")
+
+    codes = []
+    position = index_offset
+    for _ in range(count):
+        (code_length,) = ENTRY.unpack_from(data, position)
+        position += ENTRY.size
+        code = data[position:position + code_length].decode("utf-8")
+        position += code_length
+        offset, length, messages = LOCATION.unpack_from(data, position)
+        position += LOCATION.size
+
+        registry.restore(code, SnapshotRoom(data, offset, length, messages, registry.history_limit))
+        codes.append(code)
+
+    return codes
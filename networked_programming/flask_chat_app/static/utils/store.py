@@ -0,0 +1,216 @@
+import importlib
+import sqlite3
+import sys
+import time
+from collections import deque
+from queue import Empty
+
+# a function from the standard library as it was before gevent/eventlet monkey patching (ex. the real _thread.allocate_lock instead of a green lock)
+def _original(module: str, name: str):
+    if "gevent" in sys.modules:
+        from gevent import monkey
+        # NOTE: returns the current value when the module was never patched
+        return monkey.get_original(module, name)
+    if "eventlet" in sys.modules:
+        from eventlet import patcher
+        if patcher.is_monkey_patched("thread"):
+            return getattr(patcher.original(module), name)
+    return getattr(importlib.import_module(module), name)
+
+
+# a value sqlite can store as is. Anything else (ex. a dict or list a client sent as its message) is stored as its text, so it can't fail a whole batch
+def _scalar(value):
+    if value is None or isinstance(value, (str, int, float, bytes)):
+        return value
+    return str(value)
+
+
+# a queue between the socket handlers and the writer thread, built only from real OS level locks
+# NOTE: queue.Queue and threading.Thread can't be used here even when taken from before monkey patching. They get their locks from the threading module, which is patched, so they end up with green locks, and a green lock can't be waited on from (or woken up by) another OS thread. Under gevent that shows up as "LoopExit: This operation would block forever" when the server shuts down
+class _Inbox:
+    def __init__(self):
+        allocate_lock = _original("_thread", "allocate_lock")
+        self._items = deque()
+        self._mutex = allocate_lock() # guards _items and _signalled
+        self._ready = allocate_lock() # released whenever something was put since the reader last looked
+        self._ready.acquire()
+        self._signalled = False
+
+    # never blocks (the mutex is only ever held for a moment)
+    def put(self, item) -> None:
+        with self._mutex:
+            self._items.append(item)
+            if not self._signalled:
+                self._signalled = True
+                self._ready.release()
+
+    # the oldest item, waiting up to timeout seconds (forever when None). Raises queue.Empty if nothing arrived
+    # NOTE: only the writer thread reads, so there is never more than one reader waiting
+    def get(self, timeout: float = None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._mutex:
+                if self._items:
+                    return self._items.popleft()
+
+            remaining = -1 if deadline is None else deadline - time.monotonic()
+            if deadline is not None and remaining <= 0:
+                raise Empty
+            if not self._ready.acquire(timeout=remaining):
+                raise Empty
+            with self._mutex:
+                self._signalled = False
+
+    def get_nowait(self):
+        with self._mutex:
+            if self._items:
+                return self._items.popleft()
+        raise Empty
+
+
+# base class for anywhere chat messages can be permanently kept. Any backend (sqlite, postgres, files, etc.) just has to fill in these methods, so the app never needs to know which one it is talking to
+class MessageStore:
+    # queue a message to be written. This must never block the caller (it runs inside socket handlers)
+    def save(self, room: str, content: dict) -> None:
+        raise NotImplementedError
+
+    # the newest "limit" messages that were stored for a room, oldest first
+    def load(self, room: str, limit: int) -> list:
+        raise NotImplementedError
+
+    # block until everything queued so far has been written
+    def flush(self) -> None:
+        pass
+
+    # flush and release any resources (threads, connections, files)
+    def close(self) -> None:
+        pass
+
+
+# keeps nothing at all. Useful when persistence is turned off
+class NullMessageStore(MessageStore):
+    def save(self, room, content):
+        pass
+
+    def load(self, room, limit):
+        return []
+
+
+# stores messages in a local sqlite file using a write-behind queue. Socket handlers only put the message on a queue, and a single background thread writes whatever has piled up in one transaction (ie. a group commit). One commit for 200 messages costs about the same as one commit for 1 message, which is where the speed comes from
+class SQLiteMessageStore(MessageStore):
+    # sentinel put on the queue to tell the writer thread to stop
+    _STOP = object()
+
+    _INSERT = "INSERT INTO messages (room, name, message, created) VALUES (?, ?, ?, ?)"
+
+    def __init__(self, path: str, batch_size: int = 256, flush_interval: float = 0.05):
+        self.path = path
+        self.batch_size = batch_size # max messages per commit
+        self.flush_interval = flush_interval # max seconds a message waits for its batch to fill up
+
+        # create the table up front, so readers never see a missing table
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL") # NOTE: WAL mode lets readers keep reading while the writer commits
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS messages ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, room TEXT NOT NULL, name TEXT, message TEXT, created REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS messages_room ON messages (room, id)")
+
+        # NOTE: the writer has to be a real OS thread. Under gevent/eventlet a patched Thread is a green thread, so every insert and commit (an fsync) would run on the event loop and hold up every connection while it waits on the disk. It is started with the original _thread.start_new_thread, and tells close() it has finished through a real lock (see _Inbox for why not threading.Thread)
+        self._queue = _Inbox()
+        self._stopped = _original("_thread", "allocate_lock")() # held until the writer has finished
+        self._stopped.acquire()
+        self._running = True
+        _original("_thread", "start_new_thread")(self._write_loop, ())
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA synchronous=NORMAL") # NOTE: in WAL mode this only gives up the last few commits on a power cut (never consistency), and saves an fsync per commit
+        return conn
+
+    def save(self, room, content):
+        self._queue.put((str(room), _scalar(content.get("name")), _scalar(content.get("message")), time.time()))
+
+    def load(self, room, limit):
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                "SELECT name, message FROM messages WHERE room = ? ORDER BY id DESC LIMIT ?", (room, limit)
+            ).fetchall()
+        finally:
+            conn.close()
+
+        return [{"name": name, "message": message} for name, message in reversed(rows)]
+
+    def flush(self):
+        if not self._running:
+            return
+
+        # NOTE: the writer releases this lock once it has written everything that was queued before it
+        done = _original("_thread", "allocate_lock")()
+        done.acquire()
+        self._queue.put(done)
+        done.acquire()
+
+    # NOTE: a writer stuck on the disk can't hold up the process exiting for longer than "timeout" seconds
+    def close(self, timeout: float = 10):
+        if not self._running:
+            return
+
+        self._running = False
+        self._queue.put(self._STOP)
+        if not self._stopped.acquire(timeout=timeout):
+            print(f"Message store writer didn't finish within {timeout} seconds, some messages may not have been written")
+
+    # collect up to batch_size messages, waiting at most flush_interval after the first one arrives
+    # NOTE: a batch ends early at a stop or flush marker, so everything queued before the marker is written first
+    def _next_batch(self) -> list:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.flush_interval
+
+        while len(batch) < self.batch_size and isinstance(batch[-1], tuple):
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except Empty:
+                break
+
+        return batch
+
+    def _write_rows(self, conn, rows: list):
+        failed = 0
+        for row in rows:
+            try:
+                with conn:
+                    conn.execute(self._INSERT, row)
+            except (sqlite3.Error, OverflowError) as error:
+                failed += 1
+                last_error = error
+        if failed:
+            print(f"Failed to store {failed} of {len(rows)} messages: {last_error}")
+
+    def _write_loop(self):
+        # NOTE: sqlite connections can only be used by the thread that created them, so the writer owns its own
+        conn = self._connect()
+        try:
+            while True:
+                batch = self._next_batch()
+                rows = [item for item in batch if isinstance(item, tuple)]
+
+                if rows:
+                    try:
+                        with conn: # commits once for the whole batch (or rolls back if something went wrong)
+                            conn.executemany(self._INSERT, rows)
+                    except (sqlite3.Error, OverflowError):
+                        # NOTE: one bad row fails the whole batch, so the batch is written again one row at a time, and only the rows that fail on their own are lost
+                        self._write_rows(conn, rows)
+
+                marker = batch[-1]
+                if marker is self._STOP:
+                    break
+                if not isinstance(marker, tuple):
+                    marker.release() # a flush() is waiting
+        finally:
+            conn.close()
+            self._stopped.release()
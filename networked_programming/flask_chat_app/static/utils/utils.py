@@ -1,14 +1,106 @@
 import random
+import threading
 from string import ascii_uppercase
 
-# create a random code for a chat room. Check if the chat room already exists as well
-def generate_unique_code(length: int, rooms_dict: dict) -> str:
-    while True:
-        code = ""
-        for _ in range(length):
-            code += random.choice(ascii_uppercase)
+# hands out unique chat room codes in constant time, no matter how many rooms already exist
+# NOTE: the old approach (build a random code, retry while it's taken) needs more and more retries as the code space fills up, and never finishes once it's full. Instead, every code of the current length is numbered 0..26^length - 1 and a keyed shuffle (permutation) of those numbers is walked in order, so each step gives a code that was never handed out before. Codes of deleted rooms go on a free list and are reused first
+class RoomCodeAllocator:
+    def __init__(self, length: int = 4, max_load: float = 0.9, seed=None):
+        self.max_load = max_load # once this fraction of the code space is in use, codes get one letter longer
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._reset(length)
 
-        if code not in rooms_dict:
-            break
+    # start handing out codes of a new length
+    def _reset(self, length: int):
+        self.length = length
+        self.space = len(ascii_uppercase) ** length
+        self._used = set() # codes of the current length that are handed out
 
-    return code
\ No newline at end of file
+        self._next = 0 # position in the permutation
+        self._free = [] # released codes waiting to be reused
+        self._reserved = set() # codes taken with reserve() that the permutation hasn't reached yet (it skips them when it does)
+        self._keys = [self._rng.getrandbits(32) for _ in range(4)] # one secret key per feistel round
+
+        # the permutation works on bit strings, so pick an even number of bits that covers the code space
+        bits = max(2, (self.space - 1).bit_length())
+        self._half_bits = (bits + 1) // 2
+        self._half_mask = (1 << self._half_bits) - 1
+
+    # get a code no one else is using
+    def allocate(self) -> str:
+        with self._lock:
+            if self.in_use >= self.max_load * self.space:
+                self._reset(self.length + 1)
+
+            if self._free:
+                # NOTE: take a random entry (swap it to the end first) so reused codes aren't handed out in a guessable order
+                index = self._rng.randrange(len(self._free))
+                self._free[index], self._free[-1] = self._free[-1], self._free[index]
+                code = self._free.pop()
+            else:
+                code = self._encode(self._permute(self._next))
+                self._next += 1
+                while code in self._reserved:
+                    self._reserved.discard(code)
+                    code = self._encode(self._permute(self._next))
+                    self._next += 1
+
+            self._used.add(code)
+            return code
+
+    # mark a code as in use without it being handed out by allocate() (ex. rooms restored from a snapshot). Returns False if it already was in use
+    def reserve(self, code: str) -> bool:
+        with self._lock:
+            # codes of another length are never handed out at this length anyway
+            if len(code) != self.length:
+                return False
+
+            if code in self._used:
+                return False
+
+            # a code that was handed out before is either in use or on the free list, so anything else hasn't been reached by the permutation yet
+            if code in self._free:
+                self._free.remove(code)
+            else:
+                # NOTE: the code stays in the reserved set after it's released and reused from the free list, so the permutation still skips it once it gets there
+                self._reserved.add(code)
+
+            self._used.add(code)
+            return True
+
+    # codes of the current length that are handed out
+    @property
+    def in_use(self) -> int:
+        return len(self._used)
+
+    # give a code back once its room has been deleted
+    # NOTE: releasing a code that isn't in use does nothing, so a code released twice can't end up on the free list twice (and be handed out to two rooms). Codes from before the last length change aren't in use anymore either, they are simply dropped
+    def release(self, code: str) -> None:
+        with self._lock:
+            if code in self._used:
+                self._used.remove(code)
+                self._free.append(code)
+
+    def _encode(self, number: int) -> str:
+        letters = []
+        for _ in range(self.length):
+            number, digit = divmod(number, len(ascii_uppercase))
+            letters.append(ascii_uppercase[digit])
+        return "".join(reversed(letters))
+
+    # shuffle a number in range(space) to another number in range(space), never giving two inputs the same output
+    # NOTE: a 4 round feistel network is a permutation of every n bit number. Numbers that land outside the code space are fed through again (cycle walking), which takes about 2 passes on average, so this is still constant time
+    def _permute(self, number: int) -> int:
+        while True:
+            number = self._feistel(number)
+            if number < self.space:
+                return number
+
+    def _feistel(self, number: int) -> int:
+        left, right = number >> self._half_bits, number & self._half_mask
+        for key in self._keys:
+            # cheap integer mixing is plenty here, the goal is codes that don't look sequential rather than cryptography
+            mixed = ((right ^ key) * 0x9E3779B97F4A7C15) >> 17
+            left, right = right, left ^ (mixed & self._half_mask)
+        return (left << self._half_bits) | right
@@ -0,0 +1,31 @@
+import threading
+
+# gives every sender in a room a small number, so compact frames can carry [sender id, message] instead of repeating the full name in every single frame
+# NOTE: clients learn the numbers through "roster" events ({id: name}), which always go out before the first message that uses a new id
+# NOTE: the numbers live in this process, so the interned and compact formats need a single worker process (main.py refuses to start them with a message queue)
+class SenderInterner:
+    def __init__(self):
+        self._rooms = {} # room code -> {name: id}
+        self._lock = threading.Lock()
+
+    # the id of a sender in a room, and whether it was just assigned (meaning clients don't know it yet)
+    def intern(self, room: str, name: str) -> tuple:
+        with self._lock:
+            senders = self._rooms.setdefault(room, {})
+            sender_id = senders.get(name)
+            if sender_id is not None:
+                return sender_id, False
+
+            sender_id = senders[name] = len(senders)
+            return sender_id, True
+
+    # every id -> name of a room, for clients that just joined
+    # NOTE: keys are strings, since JSON (and javascript objects) only have string keys
+    def roster(self, room: str) -> dict:
+        with self._lock:
+            return {str(sender_id): name for name, sender_id in self._rooms.get(room, {}).items()}
+
+    # call once a room is deleted
+    def forget(self, room: str) -> None:
+        with self._lock:
+            self._rooms.pop(room, None)